@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+
+from flask import Blueprint, abort, current_app, jsonify, request, stream_with_context
+import football as fb
+from football import const
+from httpcache import cachedPage, leagueSeason, tableSeason
+import base64
+import datetime
+import json
+
+# JSON API - the same routes as the web pages under /api
+#
+# Results are streamed a page at a time, with a cursor for the next page.
+# Tables and graph series are columns - one array per value - rather than rows
+
+api = Blueprint("api", __name__, url_prefix="/api")
+
+
+############################################################
+# Results
+
+@api.route("/<league>/results/")
+@api.route("/<league>/results/<int:season>/")
+@api.route("/<league>/results/<int:season>/<team>/")
+@api.route("/<league>/results/<int:season>/<int:month>/")
+@api.route("/<league>/results/<int:season>/<int:month>/<team>/")
+@cachedPage(leagueSeason, streamed=True)
+def results(league, season=None, team=None, month=None):
+
+    if month != None and not 1 <= month <= 12:
+        abort(404)
+
+    # ?limit=100&after=<next from the previous page>
+    limit = request.args.get("limit", const.API_PAGE_SIZE, type=int)
+    limit = min(max(limit, 1), const.API_MAX_PAGE_SIZE)
+
+    after = __decodeCursor(request.args.get("after"))
+
+    if season == None:
+        season = fb.currentSeason()
+
+    # One more than the page so we know if there's another page
+    fixtures = fb.findFixtures(league, season, team, [], month, after, limit + 1)
+
+    def generate():
+
+        yield '{"league": ' + json.dumps(league) + ', "season": ' + json.dumps(season) + ', "results": ['
+
+        count = 0
+        last = None
+        more = False
+
+        for fixture in fixtures:
+            if count == limit:
+                more = True
+                break
+
+            yield ("," if count else "") + json.dumps(__fixtureJson(fixture))
+
+            count += 1
+            last = fixture
+
+        nextCursor = __encodeCursor(last) if more else None
+
+        yield '], "next": ' + json.dumps(nextCursor) + '}'
+
+    return current_app.response_class(stream_with_context(generate()), mimetype="application/json")
+
+
+def __fixtureJson(fixture):
+
+    return {
+        "id": fixture["_id"],
+        "date": fixture["date"].date().isoformat(),
+        "home": { item: fixture["home"][item] for item in ["team", "teamslug", "score"] },
+        "away": { item: fixture["away"][item] for item in ["team", "teamslug", "score"] }
+    }
+
+
+# Cursor for the page after a fixture - its date and home team, which is where
+# the results sort carries on from
+def __encodeCursor(fixture):
+
+    cursor = json.dumps([fixture["date"].isoformat(), fixture["home"]["team"]])
+
+    return base64.urlsafe_b64encode(cursor.encode()).decode()
+
+
+def __decodeCursor(cursor):
+
+    if not cursor:
+        return None
+
+    try:
+        date, team = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.datetime.fromisoformat(date), team
+    except (ValueError, TypeError):
+        abort(400)
+
+
+############################################################
+# Tables - { "teamslug": [...], "teamname": [...], "position": [...], "played": [...], ... }
+# with form as a string per team e.g. "WWDLW"
+
+TABLE_COLUMNS = ["played", "won", "drawn", "lost", "for", "against", "gd", "points"]
+
+@api.route("/<league>/table/")
+@api.route("/<league>/table/<int:season>/")
+@api.route("/<league>/table/<int:season>/<string:scope>/")
+@api.route("/<league>/table/until/<int:untilseason>/<int:untilmonth>/<int:untilday>/")
+@api.route("/<league>/table/until/<int:untilseason>/<int:untilmonth>/<int:untilday>/<scope>/")
+@api.route("/<league>/table/from/<int:fromseason>/<int:frommonth>/<int:fromday>/")
+@api.route("/<league>/table/from/<int:fromseason>/<int:frommonth>/<int:fromday>/<scope>/")
+@api.route("/<league>/table/from/<int:fromseason>/<int:frommonth>/<int:fromday>/until/<int:untilseason>/<int:untilmonth>/<int:untilday>/")
+@api.route("/<league>/table/from/<int:fromseason>/<int:frommonth>/<int:fromday>/until/<int:untilseason>/<int:untilmonth>/<int:untilday>/<scope>/")
+@cachedPage(tableSeason)
+def table(league, season=None, scope="totals",
+            fromseason=None, frommonth=None, fromday=None,
+            untilseason=None, untilmonth=None, untilday=None
+            ):
+
+    if scope not in ["totals", "home", "away"]:
+        abort(404)
+
+    fromdate = None
+    untildate = None
+
+    if (untilseason != None) and (untilmonth != None) and (untilday != None):
+        untildate = str(untilseason) + "-" + str(untilmonth) + "-" + str(untilday)
+
+    if (fromseason != None) and (frommonth != None) and (fromday != None):
+        fromdate = str(fromseason) + "-" + str(frommonth) + "-" + str(fromday)
+
+    league, season = tableSeason(league, season, scope, fromseason, frommonth, fromday,
+                                    untilseason, untilmonth, untilday)
+
+    if season == None:
+        season = fb.currentSeason()
+
+    view = None
+
+    if fromdate == None and untildate == None:
+        view = fb.getMaterializedSeason(league, season, ["tables." + scope])
+
+    if view != None:
+        rows = view["tables"][scope]
+    else:
+        rows = fb.getTable(league, season, scope, [], fromdate, untildate)
+
+    if not rows:
+        abort(404)
+
+    columns = {
+        "teamslug": [teamslug for teamslug, _ in rows],
+        "teamname": [team["teamname"] for _, team in rows],
+        "position": [team["position"] for _, team in rows]
+    }
+
+    for item in TABLE_COLUMNS:
+        columns[item] = [team[scope][item] for _, team in rows]
+
+    columns["form"] = ["".join(team[scope]["form"]) for _, team in rows]
+
+    return jsonify({ "league": league, "season": season, "scope": scope, "table": columns })
+
+
+############################################################
+# Graph series - positions after each match day or points each week
+# { "labels": ["10 Aug", ...], "teams": { "liverpool": [1, 3, ...], ... } }
+# ?teams=liverpool,chelsea for only those teams
+
+@api.route("/<league>/graph/<string:series>/")
+@api.route("/<league>/graph/<int:season>/<string:series>/")
+@cachedPage(leagueSeason)
+def graph(league, series, season=None):
+
+    if season == None:
+        season = fb.currentSeason()
+
+    teamFilter = [team for team in request.args.get("teams", "").split(",") if team]
+
+    if series not in ["positions", "points"]:
+        abort(404)
+
+    view = fb.getMaterializedSeason(league, season, [series])
+
+    if view != None:
+        dataArray = fb.filterGraph(view[series], teamFilter)
+    elif series == "positions":
+        dataArray = fb.buildPositionsGraph(league, season, teamFilter)
+    else:
+        dataArray = fb.buildPointsGraph(league, season, teamFilter)
+
+    if not dataArray:
+        abort(404)
+
+    header, rows = dataArray[0], dataArray[1:]
+
+    return jsonify({
+        "league": league,
+        "season": season,
+        "series": series,
+        "labels": [row[0] for row in rows],
+        "teams": { team: [row[column] for row in rows] for column, team in enumerate(header) if column > 0 }
+    })
@@ -1,14 +1,55 @@
 #!/usr/bin/env python3
 
-from flask import Flask, redirect, url_for
-from flask import render_template
+from flask import Flask, abort, redirect, url_for
+from flask import render_template, request, g
 import football as fb
 from football import const
+from httpcache import cachedPage, leagueSeason, tableSeason
+from api import api
+import metrics
+import utilities as utils
 import html
+import time
 import datetime
-from datetime import timedelta
+
+utils.configureLogging()
 
 app = Flask(__name__)
+app.register_blueprint(api)
+
+
+@app.before_request
+def startTimer():
+    g.requestStart = time.perf_counter()
+
+
+# Drop anything cached for seasons whose results another process has changed
+@app.before_request
+def syncGenerations():
+    fb.syncGenerations()
+
+
+# Streamed responses are timed until their first part is ready
+@app.after_request
+def recordTime(response):
+
+    route = request.url_rule.rule if request.url_rule != None else "unmatched"
+
+    duration = time.perf_counter() - g.requestStart
+
+    metrics.requestSeconds.observe(duration, route, request.method, str(response.status_code))
+
+    utils.debuggingPrint("%s %s %d", request.method, request.path, response.status_code, route=route, 
+                            status=response.status_code, duration=duration, **(request.view_args or {}))
+
+    return response
+
+
+# Prometheus metrics for this process
+@app.route("/metrics")
+def prometheusMetrics():
+    return app.response_class(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
 
 @app.route("/")
 def home():
@@ -21,8 +62,12 @@ def home():
 @app.route("/<league>/results/<int:season>/<team>/")
 @app.route("/<league>/results/<int:season>/<int:month>/")
 @app.route("/<league>/results/<int:season>/<int:month>/<team>/")
+@cachedPage(leagueSeason)
 def results(league, season=None, team=None, month=None):
 
+    if month != None and not 1 <= month <= 12:
+        abort(404)
+
     fixtures = fb.getFixtures(league, season, team, [], month)
     
     data = {}
@@ -44,6 +89,7 @@ def results(league, season=None, team=None, month=None):
 @app.route("/<league>/table/from/<int:fromseason>/<int:frommonth>/<int:fromday>/<scope>/")
 @app.route("/<league>/table/from/<int:fromseason>/<int:frommonth>/<int:fromday>/until/<int:untilseason>/<int:untilmonth>/<int:untilday>/")
 @app.route("/<league>/table/from/<int:fromseason>/<int:frommonth>/<int:fromday>/until/<int:untilseason>/<int:untilmonth>/<int:untilday>/<scope>/")
+@cachedPage(tableSeason)
 def tables(league=const.PREMIER_LEAGUE, season=None, scope="totals", 
             fromseason=None, frommonth=None, fromday=None,
             untilseason=None, untilmonth=None, untilday=None
@@ -58,19 +104,32 @@ def tables(league=const.PREMIER_LEAGUE, season=None, scope="totals",
 
     if (untilseason != None) and (untilmonth != None) and (untilday != None):
         untildate = str(untilseason) + "-" + str(untilmonth) + "-" + str(untilday)
-        season = fb.whichSeason(untilmonth, untilseason)
 
     if (fromseason != None) and (frommonth != None) and (fromday != None):
         fromdate = str(fromseason) + "-" + str(frommonth) + "-" + str(fromday)
-        season = fb.whichSeason(frommonth, fromseason)
+
+    league, season = tableSeason(league, season, scope, fromseason, frommonth, fromday,
+                                    untilseason, untilmonth, untilday)
 
     if season == None:
         season = fb.currentSeason()
 
-    table = fb.getTable(league, season, scope, [], fromdate, untildate)
+    # The whole season's table and graph are read from its materialized view if it's built
+    view = None
+
+    if fromdate == None and untildate == None:
+        view = fb.getMaterializedSeason(league, season, ["tables." + scope, "positions"])
+
+    if view != None:
+        table = view["tables"][scope]
+    else:
+        table = fb.getTable(league, season, scope, [], fromdate, untildate)
 
     if table:        
-        dataArray = fb.buildPositionsGraph(league, season, const.TOPTEAMS[league])
+        if view != None:
+            dataArray = fb.filterGraph(view["positions"], const.TOPTEAMS[league])
+        else:
+            dataArray = fb.buildPositionsGraph(league, season, const.TOPTEAMS[league])
 
         return render_template('table.html', data=table, scope=scope, league=league, dataArray=dataArray)
     else:
@@ -79,66 +138,22 @@ def tables(league=const.PREMIER_LEAGUE, season=None, scope="totals",
 
 
 @app.route("/bigsixform/")
-def bigsixform(league=const.PREMIER_LEAGUE, season=fb.currentSeason()):
+@cachedPage(leagueSeason)
+def bigsixform(league=const.PREMIER_LEAGUE, season=None):
 
-    teamFilter = const.TOPTEAMS[league]
-
-    data = []
-
-    for team in teamFilter:
-
-        teamdata = {}
-
-        teamdata["teamname"] = team
-        teamdata["data"] = []
-
-        teamdata["formaverage"] = 0
-
-        formtotal = 0
-        matchtotal = 0
-
-        # Get team's games against other TOPTEAMS.
-        for game in fb.getFixtures(league, season, team, teamFilter):
-
-            # 1. for each game get the opponents form upto the game date - 1            
-            form = []
-            gameDate = game["date"] - timedelta(days=1) ## MINUS ONE DAY
-
-            if game["home"]["teamslug"] == team: # Home Game
-                form = fb.getTeamFormByDate("premier-league",game["away"]["teamslug"],gameDate)
-            else:
-                form = fb.getTeamFormByDate("premier-league",game["home"]["teamslug"],gameDate)
-            
-            matchdata = {}
-
-            # Format Game.date to 27 Jan
-            game["date"] = game["date"].strftime("%d %b")
-
-            matchdata["game"] = game
-            matchdata["form"] = form
-
-            formscore = 0
-
-            for f in form:
-                if f == "W":
-                    formscore = formscore + 3
-                elif f == "D":
-                    formscore += 1
-
-            matchdata["formscore"] = formscore
-
-            teamdata["data"].append(matchdata)
-
-            if len(form) >= 4: # only count the form towards average if more than 4 games played
-                matchtotal += 1
-                formtotal = formtotal + formscore
+    if season == None:
+        season = fb.currentSeason()
 
-        teamdata["formaverage"] = round(formtotal / matchtotal,2)
+    view = fb.getMaterializedSeason(league, season, ["bigsixform"])
 
-        data.append(teamdata)
+    if view != None:
+        data = view["bigsixform"]
+    else:
+        data = fb.buildBigSixForm(league, season, const.TOPTEAMS[league])
 
     return render_template("bigsixform.html", data=data, league=league)
 
 
 if __name__ == "__main__":
-    app.run(host='0.0.0.0', port=80, debug=True)
+    # Development server - gunicorn.conf.py runs the app with several workers
+    app.run(host='0.0.0.0', port=80, debug=const.DEBUG)
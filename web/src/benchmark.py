@@ -0,0 +1,859 @@
+#!/usr/bin/env python3
+
+# Performance benchmarks
+#
+# python benchmark.py parser [pagedir]    - fixture page parsers over saved BBC pages
+# python benchmark.py plans                - fails if a hot query scans the whole collection
+# python benchmark.py import-time          - fails if importing the web app takes too long
+# python benchmark.py tables               - table builders against the database, e.g. the restored backup
+# python benchmark.py windows              - vectorized standings on synthetic seasons with many teams
+# python benchmark.py records              - memory per fixture and standings row, dictionaries against records
+# python benchmark.py suite                - hot functions and routes on synthetic leagues and the bundled backup
+
+import argparse
+import bisect
+import datetime
+import hashlib
+import random
+from collections import deque
+import glob
+import json
+import os
+import re
+import resource
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+import zipfile
+import bson
+from pymongo import MongoClient, monitoring
+import constant as const
+import football as fb
+
+
+def __printResults(results, asJson=False):
+
+    if asJson:
+        print(json.dumps(results, indent=2, default=str))
+        return
+
+    for result in results:
+        print("  ".join(str(key) + "=" + str(value) for key, value in result.items()))
+
+
+# Peak resident memory of this process in bytes
+def __peakMemory():
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+############################################################
+# Parser benchmark
+
+# Saved pages are read from the scraper's page cache (or any directory of .html
+# files). The month of each page comes from the url in its metadata file, or
+# from a YYYY-MM in the file name
+def loadPages(pageDir):
+
+    pages = []
+
+    for path in sorted(glob.glob(os.path.join(pageDir, "*.html"))):
+
+        name = path
+        metadata = path[:-len(".html")] + ".json"
+
+        if os.path.exists(metadata):
+            with open(metadata) as f:
+                name = json.load(f)["url"]
+
+        month = re.search(r"(\d{4})-(\d{2})", os.path.basename(name) if name == path else name)
+
+        if month == None:
+            continue
+
+        with open(path, "rb") as f:
+            pages.append((f.read(), int(month.group(1)), int(month.group(2))))
+
+    return pages
+
+
+def benchmarkParser(pages, parser, repeat=5):
+
+    startMemory = __peakMemory()
+    fixtures = 0
+
+    start = time.perf_counter()
+
+    for _ in range(repeat):
+        for page, year, month in pages:
+            fixtures += len(fb.parseMonthlyFixtures(page, year, month, const.PREMIER_LEAGUE, parser))
+
+    elapsed = time.perf_counter() - start
+
+    return {
+        "benchmark": "parser",
+        "parser": parser,
+        "pages": len(pages) * repeat,
+        "fixtures": fixtures,
+        "seconds": round(elapsed, 4),
+        "pages_per_sec": round(len(pages) * repeat / elapsed, 1) if elapsed else None,
+        "peak_memory_bytes": __peakMemory() - startMemory
+    }
+
+
+def runParserBenchmark(args):
+
+    pages = loadPages(args.pagedir)
+
+    if not pages:
+        print("No saved pages found in " + args.pagedir)
+        return 1
+
+    if args.parser:
+        results = [benchmarkParser(pages, args.parser, args.repeat)]
+    else:
+        # Run each parser in its own process so peak memory isn't shared
+        results = []
+
+        for parser in ["dom", "stream"]:
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "parser", args.pagedir,
+                    "--parser", parser, "--repeat", str(args.repeat), "--json"],
+                check=True, stdout=subprocess.PIPE
+            ).stdout
+
+            results.extend(json.loads(output))
+
+    __printResults(results, args.json)
+
+    return 0
+
+
+############################################################
+# Query plan check
+
+def runPlanCheck(args):
+
+    failures = fb.checkQueryPlans(args.league, args.season)
+
+    results = []
+
+    for name, stages in failures.items():
+        results.append({ "benchmark": "plans", "query": name, "stages": stages })
+
+    __printResults(results, args.json)
+
+    if failures:
+        print("Collection scans found in " + str(len(failures)) + " queries")
+        return 1
+
+    return 0
+
+
+############################################################
+# Import time budget - web workers import app.py, and with it football.py,
+# before serving anything
+
+def runImportTime(args):
+
+    results = []
+    failed = False
+
+    for module in args.modules:
+        # A fresh interpreter each time so nothing is already imported
+        timings = []
+
+        for _ in range(args.repeat):
+            output = subprocess.run(
+                [sys.executable, "-c", 
+                    "import time; start = time.perf_counter(); import " + module + "; print(time.perf_counter() - start)"],
+                check=True, stdout=subprocess.PIPE, cwd=os.path.dirname(os.path.abspath(__file__))
+            ).stdout
+
+            timings.append(float(output.decode().strip().splitlines()[-1]) * 1000)
+
+        milliseconds = min(timings)
+
+        results.append({
+            "benchmark": "import-time",
+            "module": module,
+            "milliseconds": round(milliseconds, 1),
+            "budget_milliseconds": args.budget
+        })
+
+        if milliseconds > args.budget:
+            failed = True
+
+    __printResults(results, args.json)
+
+    if failed:
+        print("Import time over budget of " + str(args.budget) + "ms")
+        return 1
+
+    return 0
+
+
+############################################################
+# Table builders - each builds the full season table plus monthly windows
+
+def benchmarkTableBuilder(league, season, builder, repeat=5):
+
+    windows = [(None, None)]
+
+    for month in range(const.SEASON_LENGTH):
+        start = datetime.datetime(season, const.SEASON_START_MONTH, 1) + datetime.timedelta(days=30 * month)
+        windows.append((start, start + datetime.timedelta(days=30)))
+
+    tables = 0
+    start = time.perf_counter()
+
+    for _ in range(repeat):
+        for fromDate, untilDate in windows:
+            standings, _, _ = fb.buildStandings(league, season, fromDate, untilDate, [], builder)
+
+            if standings != None:
+                tables += 1
+
+    elapsed = time.perf_counter() - start
+
+    return {
+        "benchmark": "tables",
+        "builder": builder,
+        "league": league,
+        "season": season,
+        "tables": tables,
+        "seconds": round(elapsed, 4),
+        "ms_per_table": round(elapsed * 1000 / tables, 2) if tables else None
+    }
+
+
+def runTableBenchmark(args):
+
+    results = []
+
+    for builder in args.builders:
+        results.append(benchmarkTableBuilder(args.league, args.season, builder, args.repeat))
+
+    __printResults(results, args.json)
+
+    return 0
+
+
+############################################################
+# Synthetic data
+
+# Results for a synthetic season - every match day each team plays one other
+# team, twice a week from the start of the season
+def syntheticSeason(league, season, teams=20, matchdays=38, seed=0):
+
+    rng = random.Random(str(seed) + league + str(season))
+
+    teamslugs = ["team-" + "{:03d}".format(team) for team in range(teams)]
+    start = datetime.datetime(season, const.SEASON_START_MONTH, 10)
+
+    fixtures = []
+
+    for matchday in range(matchdays):
+        date = start + datetime.timedelta(days=matchday * 7 // 2)
+
+        rng.shuffle(teamslugs)
+
+        for index in range(0, teams - 1, 2):
+            home, away = teamslugs[index], teamslugs[index + 1]
+
+            # League too, as synthetic leagues share team names
+            idhash = league + home + away + str(season) + str(date)
+
+            fixtures.append({
+                "_id": hashlib.sha1(idhash.encode()).hexdigest(),
+                "date": date,
+                "season": season,
+                "attendance": None,
+                "league": league,
+                "tag": "",
+                "home": { "team": home.title(), "teamslug": home, "score": rng.randint(0, 4), "players": [{}] },
+                "away": { "team": away.title(), "teamslug": away, "score": rng.randint(0, 4), "players": [{}] }
+            })
+
+    fixtures.sort(key=lambda fixture: (fixture["date"], fixture["home"]["team"]))
+
+    return fixtures
+
+
+############################################################
+# Date window tables - vectorized running totals against scanning the results
+
+# Add up the fixtures in a window one at a time, as the python builder does
+def __scanWindow(fixtures, dates, fromDate, untilDate):
+
+    standings = {}
+
+    for fixture in fixtures[bisect.bisect_left(dates, fromDate):bisect.bisect_right(dates, untilDate)]:
+        for venue, opponent in [("home", "away"), ("away", "home")]:
+            team = standings.setdefault(fixture[venue]["teamslug"], 
+                        {"played": 0, "won": 0, "drawn": 0, "lost": 0, "for": 0, "against": 0, "form": deque([], 5)})
+
+            scored, conceded = fixture[venue]["score"], fixture[opponent]["score"]
+
+            team["played"] += 1
+            team["for"] += scored
+            team["against"] += conceded
+
+            if scored > conceded:
+                team["won"] += 1
+                team["form"].append("W")
+            elif scored < conceded:
+                team["lost"] += 1
+                team["form"].append("L")
+            else:
+                team["drawn"] += 1
+                team["form"].append("D")
+
+    return standings
+
+
+def runWindowBenchmark(args):
+
+    import vectortable
+
+    rng = random.Random(args.seed)
+    results = []
+
+    for season in range(2000, 2000 + args.seasons):
+        fixtures = syntheticSeason("synthetic-league", season, args.teams, args.matchdays, args.seed)
+        dates = [fixture["date"] for fixture in fixtures]
+
+        start = time.perf_counter()
+        standings = vectortable.SeasonStandings(fixtures)
+        loadSeconds = time.perf_counter() - start
+
+        windows = []
+
+        for _ in range(args.queries):
+            first, last = sorted(rng.sample(range(len(standings.dates)), 2))
+            windows.append((standings.dates[first], standings.dates[last]))
+
+        emptyStandings = lambda: { teamslug: { scope: {"form": []} for scope in ["home", "away", "totals"] } 
+                                    for teamslug in standings.teams }
+
+        start = time.perf_counter()
+        for fromDate, untilDate in windows:
+            standings.fill(emptyStandings(), fromDate, untilDate)
+        vectorSeconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for fromDate, untilDate in windows:
+            __scanWindow(fixtures, dates, fromDate, untilDate)
+        scanSeconds = time.perf_counter() - start
+
+        results.append({
+            "benchmark": "windows",
+            "season": season,
+            "teams": args.teams,
+            "fixtures": len(fixtures),
+            "queries": args.queries,
+            "load_ms": round(loadSeconds * 1000, 2),
+            "numpy_ms_per_table": round(vectorSeconds * 1000 / args.queries, 3),
+            "scan_ms_per_table": round(scanSeconds * 1000 / args.queries, 3)
+        })
+
+    __printResults(results, args.json)
+
+    return 0
+
+
+############################################################
+# Record memory - fixtures and snapshot rows as nested dictionaries against
+# the compact records in records.py
+
+# Bytes allocated while building a list of count items
+def __allocatedBytes(build, count):
+
+    tracemalloc.start()
+
+    before = tracemalloc.get_traced_memory()[0]
+    items = [build(index) for index in range(count)]
+    after = tracemalloc.get_traced_memory()[0]
+
+    tracemalloc.stop()
+
+    del items
+
+    return after - before
+
+
+def runRecordBenchmark(args):
+
+    import copy
+    from records import Fixture, TeamStanding
+
+    fixtures = syntheticSeason("synthetic-league", 2000, args.teams, args.matchdays, args.seed)
+
+    # Copies as they come from the database - pymongo decodes every string afresh
+    documents = lambda index: copy.deepcopy(fixtures[index % len(fixtures)])
+
+    row = lambda index: {
+        "teamname": "Team-" + str(index % args.teams),
+        "totals": { "played": index % 38, "won": 0, "drawn": 0, "lost": 0, "for": index % 90,
+                    "against": 0, "gd": 0, "points": index % 100, "form": ["W", "D", "L", "W", "W"] }
+    }
+
+    def standing(index):
+        document = row(index)
+        compact = TeamStanding(document["teamname"])
+        compact.setScope("totals", document["totals"])
+        return compact
+
+    results = []
+
+    for name, before, after in [
+            ("fixture", documents, lambda index: Fixture.fromDocument(documents(index))),
+            ("standing", row, standing)]:
+
+        # Records are built from the same dictionaries, which are freed as it goes
+        beforeBytes = __allocatedBytes(before, args.count)
+        afterBytes = __allocatedBytes(after, args.count)
+
+        results.append({
+            "benchmark": "records",
+            "record": name,
+            "count": args.count,
+            "dict_bytes_each": round(beforeBytes / args.count, 1),
+            "record_bytes_each": round(afterBytes / args.count, 1),
+            "saving": str(round(100 - afterBytes * 100 / beforeBytes)) + "%" if beforeBytes else None
+        })
+
+    __printResults(results, args.json)
+
+    return 0
+
+
+############################################################
+# Benchmark suite - times the hot functions and routes on synthetic leagues and
+# the bundled backup, with the database round trips each one makes
+#
+# The data goes into a scratch database on a MongoDB server (--backend mongo)
+# or an in-memory mongomock client (--backend memory). A run can be checked
+# against an earlier run's --json output with --baseline
+
+BACKUP_ZIP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "football database backup.zip")
+
+# Collections restored from the backup - tables are built again as they're read
+BACKUP_COLLECTIONS = ["results", "seasons"]
+
+
+# Counts the commands sent to a MongoDB server, getMores included
+class RoundTrips(monitoring.CommandListener):
+
+    def __init__(self):
+        self.count = 0
+
+    def started(self, event):
+        self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+# mongomock doesn't report commands, so its collections are wrapped to count
+# the operations called on them. A cursor counts once however many documents
+# it returns
+class CountingCollection:
+
+    OPERATIONS = {"find", "find_one", "aggregate", "distinct", "count_documents",
+                    "insert_one", "insert_many", "replace_one", "update_one", "update_many",
+                    "delete_one", "delete_many", "bulk_write", "find_one_and_update",
+                    "create_index", "index_information"}
+
+    def __init__(self, collection, roundTrips):
+        self.collection = collection
+        self.roundTrips = roundTrips
+
+    def __getattr__(self, name):
+
+        attribute = getattr(self.collection, name)
+
+        if name not in self.OPERATIONS:
+            return attribute
+
+        def operation(*args, **kwargs):
+            self.roundTrips.count += 1
+            return attribute(*args, **kwargs)
+
+        return operation
+
+
+class CountingDatabase:
+
+    def __init__(self, database, roundTrips):
+        self.database = database
+        self.roundTrips = roundTrips
+
+    def __getitem__(self, name):
+        return CountingCollection(self.database[name], self.roundTrips)
+
+    def __getattr__(self, name):
+
+        if name.startswith("_"):
+            raise AttributeError(name)
+
+        return self[name]
+
+
+class CountingClient:
+
+    def __init__(self, client, roundTrips):
+        self.client = client
+        self.roundTrips = roundTrips
+
+    def __getitem__(self, name):
+        return CountingDatabase(self.client[name], self.roundTrips)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+# Points the app's database functions at the benchmark's client, returns None
+# if the backend can't be used
+def __openBenchmarkDatabase(args, roundTrips):
+
+    if args.backend == "memory":
+        try:
+            import mongomock
+        except ImportError:
+            print("The memory backend needs mongomock - pip install mongomock")
+            return None
+
+        client = CountingClient(mongomock.MongoClient(), roundTrips)
+    else:
+        client = MongoClient(
+            args.server,
+            username=args.username,
+            password=args.password,
+            serverSelectionTimeoutMS=const.MONGODB_SERVER_SELECTION_TIMEOUT,
+            event_listeners=[roundTrips]
+        )
+
+    const.MONGODB_DATABASE = args.database
+
+    fb.mongoClient = client
+    fb.mongoClientPid = os.getpid()
+
+    client.drop_database(args.database)
+
+    return fb.getDatabase()
+
+
+# Restores the backup's results and seasons - returns the seasons in it
+def loadBackup(db, path):
+
+    with zipfile.ZipFile(path) as backup:
+        for collection in BACKUP_COLLECTIONS:
+            documents = bson.decode_all(backup.read("football/" + collection + ".bson"))
+
+            if documents:
+                db[collection].insert_many(documents)
+
+    return sorted((season["league"], season["season"]) for season in db.seasons.find({}, {"league": 1, "season": 1}))
+
+
+# Stores synthetic seasons and their teams - returns the seasons made
+def loadSynthetic(db, leagues=1, seasons=1, teams=20, matchdays=38, seed=0):
+
+    loaded = []
+
+    for number in range(leagues):
+        league = "synthetic-league-" + str(number)
+
+        teamslugs = ["team-" + "{:03d}".format(team) for team in range(teams)]
+
+        # The table page's graph and the big six form page need top teams
+        const.TOPTEAMS[league] = teamslugs[:6]
+
+        for season in range(2000, 2000 + seasons):
+            db.results.insert_many(syntheticSeason(league, season, teams, matchdays, seed))
+
+            idhash = league + str(season)
+
+            db.seasons.insert_one({
+                "_id": hashlib.sha1(idhash.encode()).hexdigest(),
+                "league": league,
+                "season": season,
+                "teams": [{ "teamname": teamslug.title(), "teamslug": teamslug } for teamslug in teamslugs]
+            })
+
+            loaded.append((league, season))
+
+    return loaded
+
+
+# Median and fastest of repeat calls in milliseconds, and the round trips of a
+# call. reset runs before each call and isn't timed
+def __measure(call, repeat, roundTrips, reset=None):
+
+    timings = []
+    trips = []
+
+    for _ in range(repeat):
+        if reset != None:
+            reset()
+
+        roundTrips.count = 0
+
+        start = time.perf_counter()
+        call()
+        timings.append((time.perf_counter() - start) * 1000)
+
+        trips.append(roundTrips.count)
+
+    return {
+        "median_ms": round(statistics.median(timings), 3),
+        "min_ms": round(min(timings), 3),
+        "round_trips": statistics.median_low(trips)
+    }
+
+
+# Every hot function and route for a season, cold - nothing cached in memory or
+# stored in the tables collection - and warm, after a first call
+def benchmarkSeason(app, dataset, league, season, repeat, roundTrips):
+
+    import httpcache
+
+    db = fb.getDatabase()
+
+    buildTable = getattr(fb, "__buildTable")
+
+    teams = [team["teamslug"] for team in db.seasons.find_one({"league": league, "season": season})["teams"]]
+    seasonStart = datetime.datetime(season, const.SEASON_START_MONTH, 1)
+    formDate = datetime.datetime(season + 1, 1, 1)
+
+    client = app.test_client()
+
+    def cold():
+        fb.invalidateSeasonCaches(league, season)
+        db.tables.delete_many({"league": league, "season": season})
+        httpcache.renderedPages.clear()
+
+    def page(path):
+        return lambda: client.get(path)
+
+    # The route only serves the current premier league season, so its view is
+    # run for the season being measured
+    def bigSixForm():
+        with app.test_request_context("/bigsixform/"):
+            app.view_functions["bigsixform"].__wrapped__(league, season)
+
+    targets = [
+        ("getTable", lambda: fb.getTable(league, season, "totals"), True),
+        ("__buildTable", lambda: buildTable(league, season, seasonStart), False),
+        ("buildPositionsGraph", lambda: fb.buildPositionsGraph(league, season), True),
+        ("buildPointsGraph", lambda: fb.buildPointsGraph(league, season), True),
+        ("getTeamFormByDate", lambda: [fb.getTeamFormByDate(league, team, formDate) for team in teams], True),
+        ("/table/", page("/" + league + "/table/" + str(season) + "/"), True),
+        ("/results/", page("/" + league + "/results/" + str(season) + "/"), True),
+        ("/api/table/", page("/api/" + league + "/table/" + str(season) + "/"), True)
+    ]
+
+    if league in const.TOPTEAMS:
+        targets.append(("/bigsixform/", bigSixForm, True))
+
+    results = []
+
+    for target, call, warm in targets:
+        caches = ["cold"]
+
+        if warm:
+            caches.append("warm")
+
+        for cache in caches:
+            if cache == "cold":
+                timing = __measure(call, repeat, roundTrips, cold)
+            else:
+                cold()
+                call()
+                timing = __measure(call, repeat, roundTrips)
+
+            result = {
+                "benchmark": "suite",
+                "dataset": dataset,
+                "league": league,
+                "season": season,
+                "target": target,
+                "cache": cache
+            }
+
+            result.update(timing)
+
+            results.append(result)
+
+    return results
+
+
+# Results slower than the baseline by more than tolerance and minimumMs, or
+# making more round trips
+def __regressions(results, baseline, tolerance, minimumMs):
+
+    key = lambda result: (result["dataset"], result["league"], result["season"], result["target"], result["cache"])
+
+    previous = { key(result): result for result in baseline if result.get("benchmark") == "suite" }
+
+    regressions = []
+
+    for result in results:
+        before = previous.get(key(result))
+
+        if before == None:
+            continue
+
+        slower = result["median_ms"] - before["median_ms"]
+
+        if ((slower > before["median_ms"] * tolerance and slower > minimumMs) or
+                result["round_trips"] > before["round_trips"]):
+            regressions.append((result, before))
+
+    return regressions
+
+
+def runSuite(args):
+
+    # A scratch database is dropped before and after the run
+    if args.backend == "mongo" and args.database == const.MONGODB_DATABASE:
+        print("Use a database other than the app's own: " + args.database)
+        return 1
+
+    roundTrips = RoundTrips()
+
+    db = __openBenchmarkDatabase(args, roundTrips)
+
+    if db == None:
+        return 1
+
+    import app as webapp
+
+    seasons = []
+
+    if args.backup and os.path.exists(args.backup):
+        seasons += [("backup", league, season) for league, season in loadBackup(db, args.backup)]
+    elif args.backup:
+        print("No backup at " + args.backup + " - synthetic leagues only")
+
+    seasons += [("synthetic", league, season) for league, season in
+                    loadSynthetic(db, args.leagues, args.seasons, args.teams, args.matchdays, args.seed)]
+
+    fb.ensureIndexes(db)
+
+    results = []
+
+    try:
+        for dataset, league, season in seasons:
+            results.extend(benchmarkSeason(webapp.app, dataset, league, season, args.repeat, roundTrips))
+    finally:
+        if not args.keep:
+            fb.mongoClient.drop_database(args.database)
+
+    __printResults(results, args.json)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = __regressions(results, json.load(f), args.tolerance, args.min_ms)
+
+        for result, before in regressions:
+            print("Regression: " + result["dataset"] + " " + result["league"] + " " + str(result["season"]) + " "
+                    + result["target"] + " " + result["cache"] + " - "
+                    + str(before["median_ms"]) + "ms to " + str(result["median_ms"]) + "ms, "
+                    + str(before["round_trips"]) + " to " + str(result["round_trips"]) + " round trips",
+                    file=sys.stderr)
+
+        if regressions:
+            return 1
+
+    return 0
+
+
+def main(argv=None):
+
+    argParser = argparse.ArgumentParser(description="Football performance benchmarks")
+
+    commands = argParser.add_subparsers(dest="command")
+    commands.required = True
+
+    command = commands.add_parser("parser", help="fixture page parsers over saved pages")
+    command.add_argument("pagedir", nargs="?", default=const.PAGE_CACHE_DIR)
+    command.add_argument("--parser", choices=["dom", "stream"], help="only run one parser")
+    command.add_argument("--repeat", type=int, default=5)
+    command.add_argument("--json", action="store_true", help="machine readable output")
+    command.set_defaults(run=runParserBenchmark)
+
+    command = commands.add_parser("plans", help="fail if a hot query does a collection scan")
+    command.add_argument("--league", default=const.PREMIER_LEAGUE)
+    command.add_argument("--season", type=int, default=None)
+    command.add_argument("--json", action="store_true", help="machine readable output")
+    command.set_defaults(run=runPlanCheck)
+
+    command = commands.add_parser("import-time", help="fail if importing a module takes too long")
+    command.add_argument("modules", nargs="*", default=["football", "app"])
+    command.add_argument("--budget", type=float, default=const.IMPORT_TIME_BUDGET, help="milliseconds")
+    command.add_argument("--repeat", type=int, default=3)
+    command.add_argument("--json", action="store_true", help="machine readable output")
+    command.set_defaults(run=runImportTime)
+
+    command = commands.add_parser("tables", help="table builders against the database")
+    command.add_argument("--league", default=const.PREMIER_LEAGUE)
+    command.add_argument("--season", type=int, default=2018)
+    command.add_argument("--builders", nargs="+", default=["python", "aggregate"])
+    command.add_argument("--repeat", type=int, default=5)
+    command.add_argument("--json", action="store_true", help="machine readable output")
+    command.set_defaults(run=runTableBenchmark)
+
+    command = commands.add_parser("windows", help="vectorized date window tables on synthetic seasons")
+    command.add_argument("--seasons", type=int, default=3)
+    command.add_argument("--teams", type=int, default=400)
+    command.add_argument("--matchdays", type=int, default=150)
+    command.add_argument("--queries", type=int, default=200)
+    command.add_argument("--seed", type=int, default=0)
+    command.add_argument("--json", action="store_true", help="machine readable output")
+    command.set_defaults(run=runWindowBenchmark)
+
+    command = commands.add_parser("records", help="memory per fixture and standings row")
+    command.add_argument("--count", type=int, default=20000)
+    command.add_argument("--teams", type=int, default=20)
+    command.add_argument("--matchdays", type=int, default=38)
+    command.add_argument("--seed", type=int, default=0)
+    command.add_argument("--json", action="store_true", help="machine readable output")
+    command.set_defaults(run=runRecordBenchmark)
+
+    command = commands.add_parser("suite", help="hot functions and routes on synthetic leagues and the backup")
+    command.add_argument("--backend", choices=["mongo", "memory"], default="memory")
+    command.add_argument("--server", default="localhost:27017", help="MongoDB server for the mongo backend")
+    command.add_argument("--username", default=None)
+    command.add_argument("--password", default=None)
+    command.add_argument("--database", default="football_benchmark", help="scratch database, dropped after the run")
+    command.add_argument("--keep", action="store_true", help="keep the scratch database")
+    command.add_argument("--backup", default=BACKUP_ZIP, help="backup zip to load, empty for none")
+    command.add_argument("--leagues", type=int, default=1)
+    command.add_argument("--seasons", type=int, default=1)
+    command.add_argument("--teams", type=int, default=20)
+    command.add_argument("--matchdays", type=int, default=38)
+    command.add_argument("--seed", type=int, default=0)
+    command.add_argument("--repeat", type=int, default=5)
+    command.add_argument("--baseline", default=None, help="--json output of an earlier run to compare with")
+    command.add_argument("--tolerance", type=float, default=0.25, help="slowdown allowed against the baseline")
+    command.add_argument("--min-ms", type=float, default=1.0, help="smaller slowdowns are timing noise")
+    command.add_argument("--json", action="store_true", help="machine readable output")
+    command.set_defaults(run=runSuite)
+
+    args = argParser.parse_args(argv)
+
+    return args.run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+
+from collections import OrderedDict, deque
+import bisect
+import sys
+import threading
+
+# In-process caches for finished tables and other season data
+
+
+class LRUCache:
+
+    # Least recently used cache bounded by number of entries and/or an
+    # approximate size in bytes. None means no limit for that bound
+
+    def __init__(self, maxEntries=None, maxBytes=None):
+
+        self.maxEntries = maxEntries
+        self.maxBytes = maxBytes
+
+        self.entries = OrderedDict()    # key: (value, size)
+        self.bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return default
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+
+            return self.entries[key][0]
+
+    def put(self, key, value):
+
+        size = sizeOf(value) if self.maxBytes != None else 0
+
+        with self.lock:
+            if key in self.entries:
+                self.bytes -= self.entries.pop(key)[1]
+
+            self.entries[key] = (value, size)
+            self.bytes += size
+
+            # Evict least recently used entries until back within bounds
+            while len(self.entries) > 1 and self.__overLimit():
+                _, (_, evictedSize) = self.entries.popitem(last=False)
+                self.bytes -= evictedSize
+                self.evictions += 1
+
+    # Drop every entry whose key matches - returns number dropped
+    def dropWhere(self, match):
+
+        with self.lock:
+            keys = [key for key in self.entries if match(key)]
+
+            for key in keys:
+                self.bytes -= self.entries.pop(key)[1]
+
+        return len(keys)
+
+    def clear(self):
+
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __overLimit(self):
+
+        if self.maxEntries != None and len(self.entries) > self.maxEntries:
+            return True
+        if self.maxBytes != None and self.bytes > self.maxBytes:
+            return True
+
+        return False
+
+
+class MatchCalendar:
+
+    # Sorted match dates of a season, answering nearest date questions with
+    # bisect instead of a query each time
+
+    def __init__(self, dates):
+        self.dates = sorted(set(dates))
+
+    # First match date on or after date, or default if there isn't one
+    def nearestAfter(self, date, default=None):
+
+        index = bisect.bisect_left(self.dates, date)
+
+        return self.dates[index] if index < len(self.dates) else default
+
+    # Last match date on or before date, or default if there isn't one
+    def nearestBefore(self, date, default=None):
+
+        index = bisect.bisect_right(self.dates, date)
+
+        return self.dates[index - 1] if index else default
+
+    def first(self, default=None):
+        return self.dates[0] if self.dates else default
+
+    def last(self, default=None):
+        return self.dates[-1] if self.dates else default
+
+    def __len__(self):
+        return len(self.dates)
+
+
+# Approximate memory used by a value and everything it contains
+def sizeOf(value, seen=None):
+
+    if seen == None:
+        seen = set()
+
+    if id(value) in seen:
+        return 0
+
+    seen.add(id(value))
+
+    size = sys.getsizeof(value)
+
+    if isinstance(value, dict):
+        for key, item in value.items():
+            size += sizeOf(key, seen) + sizeOf(item, seen)
+    elif isinstance(value, (list, tuple, set, deque)):
+        for item in value:
+            size += sizeOf(item, seen)
+
+    return size
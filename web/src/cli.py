@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+
+# Scraping and maintenance jobs
+#
+# python cli.py scrape [--season 2019] [--league premier-league] [--month 8] [--months 10]
+# python cli.py build-teams [--season 2019] [--league premier-league]
+# python cli.py rebuild-tables [--season 2019] [--league premier-league]
+# python cli.py materialize [--season 2019] [--league premier-league]
+# python cli.py poll [--league premier-league] [--interval 60] [--cycles 10]
+# python cli.py --log-level DEBUG ...
+#
+# Season defaults to the current season when the command runs
+
+import argparse
+import json
+import sys
+import constant as const
+import utilities as utils
+import football as fb
+
+
+def scrape(args):
+
+    # Months before the season starts are in the following year
+    year = args.season if args.month >= const.SEASON_START_MONTH else args.season + 1
+
+    report = fb.scrapeFixtures(year, args.league, args.month, args.months,
+                                args.workers, const.BASE_URL, not args.no_cache)
+
+    return 0 if report != None else 1
+
+
+def buildTeams(args):
+
+    teams = fb.getDistinctTeams(args.league, args.season)
+
+    if not teams:
+        print("No results found for " + args.league + " " + str(args.season))
+        return 1
+
+    fb.buildLeagueTeamsList(args.league, args.season, teams)
+
+    return 0
+
+
+def rebuildTables(args):
+
+    removed = fb.rebuildTables(args.league, args.season)
+
+    print("Rebuilt tables for " + args.league + " " + str(args.season) + ", " + str(removed) + " removed")
+
+    return 0
+
+
+def materialize(args):
+
+    view = fb.materializeSeason(args.league, args.season)
+
+    if view == None:
+        print("No view built for " + args.league + " " + str(args.season))
+        return 1
+
+    print("Materialized " + args.league + " " + str(args.season) + " generation " + str(view["generation"]))
+
+    return 0
+
+
+def poll(args):
+
+    # Runs until interrupted unless a number of cycles is given
+    try:
+        for report in fb.pollFixtures(args.league, args.interval, args.cycles):
+            print(json.dumps(report))
+            sys.stdout.flush()
+    except KeyboardInterrupt:
+        pass
+
+    return 0
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description="Football scraping and maintenance jobs")
+    parser.add_argument("--log-level", default=const.LOG_LEVEL, help="DEBUG to show every query")
+
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    command = commands.add_parser("scrape", help="scrape a season's results from BBC Sport")
+    command.add_argument("--month", type=int, default=const.SEASON_START_MONTH, help="first month to scrape")
+    command.add_argument("--months", type=int, default=const.SEASON_LENGTH, help="number of months to scrape")
+    command.add_argument("--workers", type=int, default=const.SCRAPE_WORKERS, help="months fetched at once")
+    command.add_argument("--no-cache", action="store_true", help="fetch and save every month again")
+    command.set_defaults(run=scrape)
+
+    command = commands.add_parser("build-teams", help="store a season's teams from its results")
+    command.set_defaults(run=buildTeams)
+
+    command = commands.add_parser("rebuild-tables", help="remove and rebuild a season's stored tables")
+    command.set_defaults(run=rebuildTables)
+
+    command = commands.add_parser("poll", help="fetch the current month's results on an interval and update the table")
+    command.add_argument("--interval", type=float, default=const.POLL_INTERVAL, help="seconds between fetches")
+    command.add_argument("--cycles", type=int, default=None, help="stop after this many fetches")
+    command.set_defaults(run=poll)
+
+    command = commands.add_parser("materialize", help="build a season's stored table, graph and form views")
+    command.set_defaults(run=materialize)
+
+    for command in commands.choices.values():
+        command.add_argument("--league", default=const.PREMIER_LEAGUE)
+        command.add_argument("--season", type=int, default=None, help="defaults to the current season")
+
+    args = parser.parse_args(argv)
+
+    utils.configureLogging(args.log_level.upper())
+
+    if args.season == None:
+        args.season = fb.currentSeason()
+
+    return args.run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
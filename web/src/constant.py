@@ -4,12 +4,64 @@
 MONGODB_SERVER      =   "192.168.0.3"  #mongo
 MONGODB_USER        =   "football" #root
 MONGODB_PASSWORD    =   "example"
+MONGODB_DATABASE    =   "football"
 
-VERBOSE             =   True
+# Connection pool of each process's MongoClient - timeouts in milliseconds
+MONGODB_MAX_POOL_SIZE               =   20
+MONGODB_MIN_POOL_SIZE               =   0
+MONGODB_SERVER_SELECTION_TIMEOUT    =   5000
+MONGODB_CONNECT_TIMEOUT             =   5000
+MONGODB_SOCKET_TIMEOUT              =   10000
+
+# Logging - DEBUG shows every query run. LOG_STYLE "keyvalue" logs key=value
+# lines with fields such as league, season and duration, "text" LOG_FORMAT lines
+LOG_LEVEL           =   "INFO"
+LOG_STYLE           =   "keyvalue"
+LOG_FORMAT          =   "%(asctime)s %(levelname)s %(name)s %(process)d: %(message)s"
+
+# Flask debug mode - only for the development server
+DEBUG               =   False
+
+# Web serving with gunicorn (gunicorn.conf.py) - None workers for 2 per CPU + 1
+WEB_BIND            =   "0.0.0.0:80"
+WEB_WORKERS         =   None
+WEB_THREADS         =   4
+WEB_TIMEOUT         =   60
+
+# Create the indexes the queries need when first connecting
+ENSURE_INDEXES      =   True
+
+# Most time importing the web app may take, in milliseconds
+IMPORT_TIME_BUDGET  =   500
 
 # dateslug "/2019-04"
 BASE_URL = "https://www.bbc.co.uk/sport/football/LEAGUETAG/scores-fixtures/"
 
+# Scraping - months fetched concurrently, simultaneous requests per host,
+# retries with exponential backoff and request timeout in seconds
+SCRAPE_WORKERS              =   4
+SCRAPE_HOST_CONCURRENCY     =   4
+SCRAPE_RETRIES              =   3
+SCRAPE_BACKOFF              =   0.5
+SCRAPE_TIMEOUT              =   10
+
+# Scraped pages are cached here. A month's page is final, and never fetched
+# again, once the month ended more than PAGE_FINAL_AFTER_DAYS ago
+PAGE_CACHE_DIR              =   "pagecache"
+PAGE_FINAL_AFTER_DAYS       =   7
+
+# Fixture page parser - "stream" or "dom"
+FIXTURE_PARSER              =   "stream"
+
+# Number of scraped results written to the database per bulk write
+RESULTS_BATCH_SIZE          =   500
+
+# Build the materialized views (snapshots collection) of seasons with new results after scraping
+MATERIALIZE_AFTER_SCRAPE    =   True
+
+# Seconds between fetches of the current month's results by cli.py poll
+POLL_INTERVAL               =   60
+
 SEASON_START_MONTH  =   8
 SEASON_LENGTH       =   10
 
@@ -20,13 +72,77 @@ POINTS_WIN      =   3
 POINTS_DRAW     =   1
 POINTS_LOSS     =   0
 
+# Seconds between web workers' checks for results saved by other processes -
+# 0 to check on every request
+GENERATION_CHECK_INTERVAL   =   2
+
+# In-process cache of finished tables - None for no limit
+TABLE_CACHE_MAX_ENTRIES =   256
+TABLE_CACHE_MAX_BYTES   =   None
+
+# How tables are added up - "python", "aggregate" to run it in MongoDB or
+# "numpy" for vectorized running totals of the season
+TABLE_BUILDER           =   "python"
+
+# Stored table document version - part of each table's _id so tables saved in
+# an older format are built again rather than read back
+TABLE_FORMAT            =   3
+
+# tables collection - tables unused for TABLES_TTL seconds expire and the
+# collection is trimmed to TABLES_MAX_DOCUMENTS every TABLES_TRIM_INTERVAL saves
+TABLES_TTL              =   30 * 24 * 60 * 60
+TABLES_MAX_DOCUMENTS    =   1000
+TABLES_TRIM_INTERVAL    =   50
+
+# HTTP caching of pages - seconds browsers and proxies may reuse a page before
+# checking back with its ETag. Past seasons' pages no longer change
+PAGE_MAX_AGE                =   60
+PAGE_MAX_AGE_PAST_SEASON    =   24 * 60 * 60
+
+# Rendered pages kept in memory per ETag and content encoding
+RENDERED_PAGES_MAX_ENTRIES  =   512
+RENDERED_PAGES_MAX_BYTES    =   64 * 1024 * 1024
+
+# Pages smaller than this many bytes are sent uncompressed
+COMPRESS_MIN_SIZE           =   500
+COMPRESS_LEVEL              =   6
+
+# JSON API - results per page by default and at most
+API_PAGE_SIZE               =   100
+API_MAX_PAGE_SIZE           =   1000
+
+# Prometheus metrics at /metrics - histogram buckets in seconds for request
+# times and MongoDB command times. With METRICS_DIR set each process writes its
+# numbers to a file of its own there every METRICS_WRITE_INTERVAL seconds and
+# /metrics adds up every process's, gunicorn.conf.py sets it for its workers.
+# None keeps a process's metrics to itself, e.g. the development server
+METRICS_DIR                 =   None
+METRICS_WRITE_INTERVAL      =   5
+METRICS_REQUEST_BUCKETS     =   [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+METRICS_COMMAND_BUCKETS     =   [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1]
+
 # Leagues
 PREMIER_LEAGUE  =   "premier-league"
 CHAMPIONSHIP    =   "championship"
 LA_LIGA         =   "spanish-la-liga"
 
+# Table ranking - values compared in order, highest first, then by teamslug.
+# "h2h points", "h2h gd" and "h2h for" only count the games between the teams
+# level on every value before the first of them, and in the home and away
+# tables only the games at that venue
+DEFAULT_RANKING = ["points", "gd", "for"]
+
+TABLE_RANKING = {
+            PREMIER_LEAGUE : ["points", "gd", "for"],
+            CHAMPIONSHIP : ["points", "gd", "for"],
+            LA_LIGA : ["points", "h2h points", "h2h gd", "gd", "for"]
+        }
+
 
 TOPTEAMS = {
             "premier-league" : ["liverpool","manchester-united","manchester-city","arsenal","chelsea","tottenham-hotspur"],
             "spanish-la-liga" : ["real-madrid","barcelona","valencia","sevilla","atletico-madrid"]
         }
+
+# Leagues whose current season is built by warmCaches() as each web worker starts
+WARM_LEAGUES = [PREMIER_LEAGUE, LA_LIGA]
@@ -1,7 +1,12 @@
 #!/usr/bin/env python3
 
-from lxml import html
-import requests
+from lxml import html, etree
+import io
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import os
+import json
 import pymongo
 from pymongo import MongoClient
 from dateutil.parser import parse
@@ -11,29 +16,306 @@ import time
 from datetime import timedelta
 import constant as const
 import utilities as utils
+import metrics
+from cache import LRUCache, MatchCalendar
+from records import Fixture, TeamStanding
 from collections import deque
+import bisect
 
 # BBC Sport Football results scraper v0.3
 
+# One MongoClient per process. A client inherited from the parent of a forked
+# web worker shares the parent's sockets, so the worker makes its own on first use
 mongoClient = None
+mongoClientPid = None
+mongoClientLock = threading.Lock()
 
 def getDatabase():
 
-    global mongoClient
+    global mongoClient, mongoClientPid
+
+    if mongoClient == None or mongoClientPid != os.getpid():
+        with mongoClientLock:
+            if mongoClient == None or mongoClientPid != os.getpid():
+                mongoClient = MongoClient(
+                    const.MONGODB_SERVER,
+                    username=const.MONGODB_USER,
+                    password=const.MONGODB_PASSWORD,
+                    maxPoolSize=const.MONGODB_MAX_POOL_SIZE,
+                    minPoolSize=const.MONGODB_MIN_POOL_SIZE,
+                    serverSelectionTimeoutMS=const.MONGODB_SERVER_SELECTION_TIMEOUT,
+                    connectTimeoutMS=const.MONGODB_CONNECT_TIMEOUT,
+                    socketTimeoutMS=const.MONGODB_SOCKET_TIMEOUT,
+                    connect=False,
+                    event_listeners=[metrics.commandListener]
+                )
+                mongoClientPid = os.getpid()
 
-    if mongoClient == None:
-        mongoClient = MongoClient(
-            const.MONGODB_SERVER,
-            username=const.MONGODB_USER,
-            password=const.MONGODB_PASSWORD
-        )
-    return mongoClient.football
+                if const.ENSURE_INDEXES:
+                    ensureIndexes(mongoClient[const.MONGODB_DATABASE])
+
+    return mongoClient[const.MONGODB_DATABASE]
 
 
 def closeDatabase():
     
-    if mongoClient != None:
-        mongoClient.close()     
+    global mongoClient
+
+    # Only close a client this process made - the parent's is still in use
+    if mongoClient != None and mongoClientPid == os.getpid():
+        mongoClient.close()
+
+    mongoClient = None
+
+
+# Indexes for the queries run against each collection
+#
+# results:  league + season + date + home.team  - season queries sorted by date, date ranges
+#           league + season + home.teamslug     - club and team filter queries
+#           league + season + away.teamslug
+# seasons:  league + season
+# snapshots: league + season + generation       - materialized season views
+INDEXES = {
+    "results": [
+        [("league", 1), ("season", 1), ("date", 1), ("home.team", 1)],
+        [("league", 1), ("season", 1), ("home.teamslug", 1), ("date", 1)],
+        [("league", 1), ("season", 1), ("away.teamslug", 1), ("date", 1)]
+    ],
+    "seasons": [
+        [("league", 1), ("season", 1)]
+    ],
+    "snapshots": [
+        [("league", 1), ("season", 1), ("generation", 1)]
+    ]
+}
+
+# The tables collection is a cache of built tables. Unused tables expire after
+# TABLES_TTL seconds and the collection is trimmed back to TABLES_MAX_DOCUMENTS
+tablesSaved = 0
+tablesSavedLock = threading.Lock()
+
+# Create any missing indexes and check they're all in place
+# Returns a list of (collection, keys) for indexes that are missing
+def ensureIndexes(db=None):
+
+    if db == None:
+        db = getDatabase()
+
+    missing = []
+
+    try:
+        for collection in INDEXES:
+            for keys in INDEXES[collection]:
+                db[collection].create_index(keys)
+
+        # "created" is refreshed every time a table is read, so this expires the
+        # least recently used tables
+        db.tables.create_index("created", expireAfterSeconds=const.TABLES_TTL)
+
+        # Verify
+        for collection in INDEXES:
+            existing = [index["key"] for index in db[collection].index_information().values()]
+
+            for keys in INDEXES[collection]:
+                if keys not in existing:
+                    missing.append((collection, keys))
+
+    except (pymongo.errors.ServerSelectionTimeoutError, pymongo.errors.OperationFailure) as e:
+        utils.logger.error(e)
+
+    for collection, keys in missing:
+        utils.logger.warning("Missing index on %s: %s", collection, keys)
+
+    return missing
+
+# Remove a season's stored tables and build its full tables and snapshots again
+def rebuildTables(league, season):
+
+    db = getDatabase()
+
+    removed = db.tables.delete_many({"league": league, "season": season}).deleted_count
+
+    utils.debuggingPrint("Removed %d tables", removed)
+
+    invalidateSeasonCaches(league, season)
+
+    for scope in ["totals", "home", "away"]:
+        getTable(league, season, scope)
+
+    getSeasonSnapshots(league, season)
+
+    return removed
+
+# Queries run by the web pages for a season, as (query, sort). 
+# checkQueryPlans() makes sure none of these scans the whole collection
+def __hotQueries(league, season):
+
+    teamFilter = const.TOPTEAMS.get(league, [])
+    team = teamFilter[0] if teamFilter else ""
+    startDate = datetime.datetime(season, const.SEASON_START_MONTH, 1)
+
+    byDate = [("date", 1), ("home.team", 1)]
+
+    seasonQuery = { "league": league, "season": season }
+    windowQuery = { "league": league, "season": season, "date": {"$gte": startDate, "$lte": startDate + timedelta(days=90)} }
+
+    return {
+        "getFixtures": (__fixturesQuery(league, season), byDate),
+        "getFixtures club": (__fixturesQuery(league, season, team), byDate),
+        "getFixtures month": (__fixturesQuery(league, season, None, [], const.SEASON_START_MONTH), byDate),
+        "getFixtures teamFilter": (__fixturesQuery(league, season, None, teamFilter), byDate),
+        "getFixturesBatch": (__fixturesBatchQuery([league], [season, season - 1], teamFilter), byDate),
+        "getSeasonCalendar": (seasonQuery, [("date", const.SORT_ORDER_ASC)]),
+        "getSeasonCalendar teamFilter": (__fixturesQuery(league, season, None, teamFilter), [("date", const.SORT_ORDER_ASC)]),
+        "buildTable": (windowQuery, byDate),
+        "buildSeasonSnapshots": (seasonQuery, byDate)
+    }
+
+# Explain each hot query - returns { name: [plan stages] } for any query whose
+# winning plan is a collection scan
+def checkQueryPlans(league=const.PREMIER_LEAGUE, season=None):
+
+    if season == None:
+        season = currentSeason()
+
+    db = getDatabase()
+
+    failures = {}
+
+    for name, (query, sort) in __hotQueries(league, season).items():
+        plan = db.results.find(query).sort(sort).explain()["queryPlanner"]["winningPlan"]
+
+        stages = __planStages(plan)
+
+        if "COLLSCAN" in stages:
+            failures[name] = stages
+
+    return failures
+
+def __planStages(plan):
+
+    stages = [plan.get("stage")]
+
+    if "inputStage" in plan:
+        stages.extend(__planStages(plan["inputStage"]))
+
+    for inputStage in plan.get("inputStages", []):
+        stages.extend(__planStages(inputStage))
+
+    # Newer servers wrap the plan in a query plan section
+    if "queryPlan" in plan:
+        stages.extend(__planStages(plan["queryPlan"]))
+
+    return stages
+
+# Remove the least recently used tables beyond the document budget
+def trimTables(maxDocuments=const.TABLES_MAX_DOCUMENTS):
+
+    db = getDatabase()
+
+    if db.tables.estimated_document_count() <= maxDocuments:
+        return 0
+
+    # created of the newest table that's over budget
+    for table in db.tables.find({}, {"created": 1}).sort("created", const.SORT_ORDER_DESC).skip(maxDocuments).limit(1):
+        removed = db.tables.delete_many({"created": {"$lte": table["created"]}}).deleted_count
+        utils.debuggingPrint("Trimmed %d tables", removed)
+        return removed
+
+    return 0
+
+
+# Data generation of each (league, season) as last read from or written to the
+# generations collection. Bumped whenever the scraper saves new results
+seasonGenerations = {}
+
+def __generationId(league, season):
+    idhash = league + str(season)
+    return hashlib.sha1(idhash.encode()).hexdigest()
+
+def getGeneration(league, season):
+
+    key = (league, season)
+
+    if key not in seasonGenerations:
+        db = getDatabase()
+
+        generation = db.generations.find_one({"_id": __generationId(league, season)})
+
+        seasonGenerations[key] = generation["generation"] if generation else 0
+
+    return seasonGenerations[key]
+
+def bumpGeneration(league, season):
+
+    # Generations format
+    #
+    # _id:          - SHA1 hash of league + season
+    # league:       - league tag e.g. premier-league
+    # season:       - season id tag e.g. 2018
+    # generation:   - incremented every time results for the season change
+
+    db = getDatabase()
+
+    generation = db.generations.find_one_and_update(
+        {"_id": __generationId(league, season)},
+        {"$inc": {"generation": 1}, "$setOnInsert": {"league": league, "season": season}},
+        upsert=True, return_document=pymongo.ReturnDocument.AFTER
+    )
+
+    seasonGenerations[(league, season)] = generation["generation"]
+
+    # Anything cached for the season is now out of date
+    invalidateSeasonCaches(league, season)
+
+    return generation["generation"]
+
+
+# When syncGenerations() last read the generations collection
+generationsChecked = None
+generationsLock = threading.Lock()
+
+# Pick up generations bumped by other processes - the scraper, poller or another
+# web worker - and drop what this process has cached for those seasons only.
+# Reads the generations collection at most every GENERATION_CHECK_INTERVAL seconds
+# Returns the (league, season) of each season whose caches were dropped
+def syncGenerations(force=False):
+
+    global generationsChecked
+
+    if not force and generationsChecked != None and \
+        time.monotonic() - generationsChecked < const.GENERATION_CHECK_INTERVAL:
+        return []
+
+    # Another thread is already checking
+    if not generationsLock.acquire(blocking=False):
+        return []
+
+    changed = []
+
+    try:
+        generationsChecked = time.monotonic()
+
+        db = getDatabase()
+
+        for generation in db.generations.find({}, {"league": 1, "season": 1, "generation": 1}):
+            key = (generation["league"], generation["season"])
+
+            if key in seasonGenerations and seasonGenerations[key] != generation["generation"]:
+                changed.append(key)
+
+            seasonGenerations[key] = generation["generation"]
+
+    except pymongo.errors.PyMongoError as e:
+        utils.logger.error(e)
+    finally:
+        generationsLock.release()
+
+    for league, season in changed:
+        utils.debuggingPrint("Results changed for %s %s", league, season)
+        invalidateSeasonCaches(league, season)
+
+    return changed
 
 
 def whichSeason(month, year, fulldate=None):
@@ -68,24 +350,252 @@ def __teamnameSlugReverse(teamslug):
     return teamslug.title().replace("-", " ")
 
 
+# One keep-alive HTTP session is shared by every scraping thread
+httpSession = None
+httpSessionLock = threading.Lock()
+
+# Limit on simultaneous requests to each host
+hostSemaphores = {}
+
+def __getHttpSession():
+
+    global httpSession
+
+    # requests is only imported when scraping, web workers never need it
+    import requests
+    from urllib3.util.retry import Retry
+
+    with httpSessionLock:
+        if httpSession == None:
+            # Retry connection errors and busy/failing responses with exponential backoff
+            retries = Retry(
+                total=const.SCRAPE_RETRIES,
+                backoff_factor=const.SCRAPE_BACKOFF,
+                status_forcelist=[429, 500, 502, 503, 504]
+            )
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=const.SCRAPE_WORKERS,
+                pool_maxsize=const.SCRAPE_WORKERS,
+                max_retries=retries
+            )
+
+            httpSession = requests.Session()
+            httpSession.mount("http://", adapter)
+            httpSession.mount("https://", adapter)
+
+    return httpSession
+
+def __getHostSemaphore(url):
+
+    host = urlparse(url).netloc
+
+    with httpSessionLock:
+        if host not in hostSemaphores:
+            hostSemaphores[host] = threading.BoundedSemaphore(const.SCRAPE_HOST_CONCURRENCY)
+
+    return hostSemaphores[host]
+
+# Returns the response for url - headers are added to the request
+def __fetchPage(url, headers={}):
+
+    session = __getHttpSession()
+
+    with __getHostSemaphore(url):
+        page = session.get(url, headers=headers, timeout=const.SCRAPE_TIMEOUT)
+
+    page.raise_for_status()
+
+    return page
+
+
+# Page cache - every scraped page is kept in PAGE_CACHE_DIR, named by the SHA1
+# hash of its url, with a metadata file alongside it
+#
+# {
+#   "url": url of the page,
+#   "etag": ETag header of the last response,
+#   "lastmodified": Last-Modified header of the last response,
+#   "final": True once the month is over and its results can't change,
+#   "fixtures": { _id: [homescore, awayscore] } - fixtures on the page when last saved
+# }
+
+def __pageCachePath(url, extension):
+    return os.path.join(const.PAGE_CACHE_DIR, hashlib.sha1(url.encode()).hexdigest() + extension)
+
+def __readPageCache(url):
+
+    try:
+        with open(__pageCachePath(url, ".json")) as f:
+            return json.load(f)
+    except (OSError, ValueError): # Not cached or unreadable
+        return None
+
+def __writePageCache(entry, page=None):
+
+    os.makedirs(const.PAGE_CACHE_DIR, exist_ok=True)
+
+    if page != None:
+        with open(__pageCachePath(entry["url"], ".html"), "wb") as f:
+            f.write(page)
+
+    with open(__pageCachePath(entry["url"], ".json"), "w") as f:
+        json.dump(entry, f)
+
+# A month is final once it ended more than PAGE_FINAL_AFTER_DAYS ago
+def __isFinalMonth(year, month):
+
+    monthEnd = datetime.datetime(year + month // 12, month % 12 + 1, 1)
+
+    return monthEnd + timedelta(days=const.PAGE_FINAL_AFTER_DAYS) < datetime.datetime.now()
+
+
 # __scrapeMonthlyFixtures() returns a list of dictionary objects.
 # Each dictionary contains details of one fixture
-def __scrapeMonthlyFixtures(dateslugyear=None, dateslugmonth=None, league=const.PREMIER_LEAGUE):
+# With pageCache the list only holds fixtures that are new or changed since the
+# page was last saved, and the page cache entry to save is returned with it
+def __scrapeMonthlyFixtures(dateslugyear=None, dateslugmonth=None, league=const.PREMIER_LEAGUE, 
+                            baseUrl=const.BASE_URL, pageCache=False):
 
     if dateslugyear == None or dateslugmonth == None:
         return None
 
     dateslug = str(dateslugyear) + "-" + "{:02d}".format(dateslugmonth)
 
-    seasontag = whichSeason(dateslugmonth, dateslugyear)
+    url = baseUrl.replace("LEAGUETAG", league) + dateslug + "?filter=results"
 
-    url = const.BASE_URL.replace("LEAGUETAG", league) + dateslug + "?filter=results"
+    if not pageCache:
+        utils.debuggingPrint("Scraping %s", url)
 
-    utils.debuggingPrint("Scraping " + url)
-    
-    page = requests.get(url)
+        return parseMonthlyFixtures(__fetchPage(url).content, dateslugyear, dateslugmonth, league)
+
+    entry = __readPageCache(url)
+
+    if entry and entry["final"]:
+        utils.debuggingPrint("Skipping final month %s", url)
+        return [], None
+
+    # Conditional request - unchanged pages come back as 304 Not Modified
+    headers = {}
+
+    if entry:
+        if entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["lastmodified"]:
+            headers["If-Modified-Since"] = entry["lastmodified"]
+    else:
+        entry = { "url": url, "etag": None, "lastmodified": None, "final": False, "fixtures": {} }
+
+    utils.debuggingPrint("Scraping %s", url)
+
+    page = __fetchPage(url, headers)
+
+    entry["final"] = __isFinalMonth(dateslugyear, dateslugmonth)
+
+    if page.status_code == 304:
+        utils.debuggingPrint("Not modified %s", url)
+        return [], entry
+
+    entry["etag"] = page.headers.get("ETag")
+    entry["lastmodified"] = page.headers.get("Last-Modified")
+    entry["page"] = page.content
+
+    # Keep fixtures that weren't on the page last time or whose score has changed
+    data = []
+    fixtures = {}
+
+    for fixture in parseMonthlyFixtures(page.content, dateslugyear, dateslugmonth, league):
+        score = [fixture["home"]["score"], fixture["away"]["score"]]
+
+        if entry["fixtures"].get(fixture["_id"]) != score:
+            data.append(fixture)
+
+        fixtures[fixture["_id"]] = score
+
+    entry["fixtures"] = fixtures
+
+    return data, entry
+
+
+# Parse the fixtures out of a BBC monthly results page
+# parser is "stream" to read the fixtures as the page is parsed, or "dom" to
+# build the whole document first
+def parseMonthlyFixtures(page, dateslugyear, dateslugmonth, league=const.PREMIER_LEAGUE, parser=None):
+
+    if parser == None:
+        parser = const.FIXTURE_PARSER
+
+    if parser == "dom":
+        return __parseMonthlyFixturesDom(page, dateslugyear, dateslugmonth, league)
+
+    return __parseMonthlyFixturesStream(page, dateslugyear, dateslugmonth, league)
+
+
+def __parseMonthlyFixturesStream(page, dateslugyear, dateslugmonth, league=const.PREMIER_LEAGUE):
+
+    seasontag = int(whichSeason(dateslugmonth, dateslugyear))
+
+    data = []
+    matchDate = None
+
+    # Only fixture articles and date headings are looked at, and each is
+    # discarded as soon as it has been read
+    for _, element in etree.iterparse(io.BytesIO(page), events=("end",), tag=("article", "h3"), html=True):
+
+        elementClass = element.get("class")
+
+        if elementClass == "gel-minion sp-c-match-list-heading":  # It's a date
+            matchDate = parse("".join(element.itertext()) + " " + str(dateslugyear))
+
+        elif elementClass == "sp-c-fixture":  # It's a fixture
+            details = element.xpath("descendant::span/text()", smart_strings=False)
+
+            if len(details) >= 4:
+                data.append(__fixtureDetails(details[0], int(details[1]), details[2], int(details[3]),
+                                matchDate, seasontag, league))
+        else:
+            continue
+
+        # Free the element and everything parsed before it
+        element.clear()
+
+        while element.getprevious() is not None:
+            del element.getparent()[0]
+
+    return data
+
+
+# Returns the dictionary for one fixture - matchDate is a datetime
+def __fixtureDetails(homeTeam, homeScore, awayTeam, awayScore, matchDate, seasontag, league):
+
+    idhash = homeTeam + awayTeam + str(seasontag) + str(matchDate)
+
+    return {
+        "_id": hashlib.sha1(idhash.encode()).hexdigest(),
+        "date": matchDate,
+        "season": seasontag,
+        "attendance": None,
+        "league": league,
+        "tag": "",
+        "home": {
+            "team": homeTeam,
+            "teamslug": __teamnameSlug(homeTeam),
+            "score": homeScore,
+            "players": [{}]
+        },
+        "away": {
+            "team": awayTeam,
+            "teamslug": __teamnameSlug(awayTeam),
+            "score": awayScore,
+            "players": [{}]
+        }
+    }
+
+
+def __parseMonthlyFixturesDom(page, dateslugyear, dateslugmonth, league=const.PREMIER_LEAGUE):
+
+    seasontag = whichSeason(dateslugmonth, dateslugyear)
 
-    tree = html.fromstring(page.content)
+    tree = html.fromstring(page)
 
     xpathFixtures = '//article[@class="sp-c-fixture"]/descendant::span/text()'
     xpathDates = '//h3[@class="gel-minion sp-c-match-list-heading"]'
@@ -154,18 +664,22 @@ def __scrapeMonthlyFixtures(dateslugyear=None, dateslugmonth=None, league=const.
     return data
 
 # Get fixtures for named season - August to May - i.e 10 months
-def scrapeFixtures(currentyear=currentSeason(), league=const.PREMIER_LEAGUE, 
-                    currentmonth=const.SEASON_START_MONTH, numberofmonths=const.SEASON_LENGTH
+# Months are fetched concurrently by up to workers threads - 1 fetches them in turn
+# With pageCache only pages that changed since the last scrape are parsed, months
+# that are over are skipped and only new or changed fixtures are saved
+def scrapeFixtures(currentyear=None, league=const.PREMIER_LEAGUE, 
+                    currentmonth=const.SEASON_START_MONTH, numberofmonths=const.SEASON_LENGTH,
+                    workers=const.SCRAPE_WORKERS, baseUrl=const.BASE_URL, pageCache=True
                 ):
 
-    # Store results in list of match dictionaries
-    results = []
+    if currentyear == None:
+        currentyear = currentSeason()
 
-    for _ in range(numberofmonths):
+    months = []
 
-        results.extend(__scrapeMonthlyFixtures(currentyear, currentmonth, league))
+    for _ in range(numberofmonths):
 
-        utils.debuggingPrint("Getting: " + str(currentmonth) + " " + str(currentyear))
+        months.append((currentyear, currentmonth))
 
         if currentmonth >= 12:
             currentmonth = 1
@@ -173,411 +687,1296 @@ def scrapeFixtures(currentyear=currentSeason(), league=const.PREMIER_LEAGUE,
         else:
             currentmonth += 1
 
+    def scrapeMonth(month):
+
+        utils.debuggingPrint("Getting: %s %s", month[1], month[0])
+
+        try:
+            if pageCache:
+                return __scrapeMonthlyFixtures(month[0], month[1], league, baseUrl, True)
+            else:
+                return __scrapeMonthlyFixtures(month[0], month[1], league, baseUrl), None
+        except IOError as e: # requests exceptions are IOErrors
+            utils.logger.error(e, extra={"league": league, "year": month[0], "month": month[1]})
+            return [], None
+
+    # Store results in list of match dictionaries
+    results = []
+    pages = []
+
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            scraped = list(executor.map(scrapeMonth, months))
+    else:
+        scraped = [scrapeMonth(month) for month in months]
+
+    for fixtures, entry in scraped:
+        results.extend(fixtures)
+
+        if entry != None:
+            pages.append(entry)
+
+    report = saveResults(results)
+
+    if report == None:
+        # Leave the page cache as it was so the fixtures are scraped again
+        return None
+
+    for entry in pages:
+        __writePageCache(entry, entry.pop("page", None))
+
+    # Build the pages of every season with new results ahead of their requests
+    if const.MATERIALIZE_AFTER_SCRAPE:
+        for changedLeague, changedSeason in report["seasons"]:
+            materializeSeason(changedLeague, changedSeason)
+
+    return report
+
+
+# Save results to the database, batchSize at a time, keyed on their _id hash.
+# New fixtures are inserted, fixtures whose score has changed are updated and
+# the rest are left alone
+#
+# Returns a report of the changes or None if the results couldn't all be stored
+#
+# {
+#   "inserted": [ _id of each new fixture ],
+#   "updated": [ _id of each fixture with a changed score ],
+#   "unchanged": number of fixtures already stored as they are,
+#   "seasons": [ (league, season) of every changed fixture ]
+# }
+def saveResults(results, batchSize=const.RESULTS_BATCH_SIZE):
+
     # Store data in MongoDB
     db = getDatabase()
     # specify collection
     collection = db.results
 
-    utils.debuggingPrint("Saving " + str(len(results)) + " results" )
+    utils.debuggingPrint("Saving %d results", len(results))
+
+    start = time.perf_counter()
+
+    report = { "inserted": [], "updated": [], "unchanged": 0, "seasons": [] }
+    changedSeasons = set()
+    stored = True
+
+    try:
+        for index in range(0, len(results), batchSize):
+            batch = results[index:index + batchSize]
+
+            # Scores already stored for the fixtures in this batch
+            existing = db.results.find(
+                {"_id": {"$in": [result["_id"] for result in batch]}},
+                {"home.score": 1, "away.score": 1}
+            )
+            scores = { fixture["_id"]: (fixture["home"]["score"], fixture["away"]["score"]) for fixture in existing }
+
+            operations = []
+            inserted = []
+            updated = []
+
+            for result in batch:
+                score = (result["home"]["score"], result["away"]["score"])
+
+                if result["_id"] not in scores:
+                    fixture = dict(result)
+                    fixture.pop("_id")
+
+                    operations.append(pymongo.UpdateOne({"_id": result["_id"]}, {"$setOnInsert": fixture}, upsert=True))
+                    inserted.append(result)
+
+                elif scores[result["_id"]] != score:
+                    operations.append(pymongo.UpdateOne({"_id": result["_id"]}, 
+                        {"$set": {"home.score": score[0], "away.score": score[1]}}))
+                    updated.append(result)
+
+                else:
+                    report["unchanged"] += 1
+
+            if operations:
+                collection.bulk_write(operations, ordered=False)
+
+            report["inserted"].extend(result["_id"] for result in inserted)
+            report["updated"].extend(result["_id"] for result in updated)
+            changedSeasons.update((result["league"], result["season"]) for result in inserted + updated)
+
+    except pymongo.errors.PyMongoError as e:
+        utils.logger.error(e)
+        stored = False
+
+    report["seasons"] = sorted(changedSeasons)
+
+    utils.logger.info("Results saved: %d inserted, %d updated, %d unchanged",
+            len(report["inserted"]), len(report["updated"]), report["unchanged"],
+            extra={"inserted": len(report["inserted"]), "updated": len(report["updated"]), 
+                    "unchanged": report["unchanged"], "duration": time.perf_counter() - start})
+
+    # Changed results make anything cached for their seasons out of date
+    for league, season in report["seasons"]:
+        bumpGeneration(league, season)
+
+    return report if stored else None
+
+
+def getFixtures(league=const.PREMIER_LEAGUE, season=None, club=None, teamFilter = [], month=None):
+    
+    # Sanity check
+    if season == None:
+        season = currentSeason()
+    if league == None:
+        league = const.PREMIER_LEAGUE
+
+    return [Fixture.fromDocument(fixture) for fixture in findFixtures(league, season, club, teamFilter, month)]
+
+
+# Cursor over fixtures in date order, for reading them a page at a time.
+# after is the (date, home team) of the last fixture already read and limit
+# the most to return - None for no limit
+def findFixtures(league=const.PREMIER_LEAGUE, season=None, club=None, teamFilter=[], month=None, 
+                after=None, limit=None):
+
+    if season == None:
+        season = currentSeason()
+
+    db = getDatabase()
+ 
+    resultsQuery = __fixturesQuery(league, season, club, teamFilter, month)
+
+    # Fixtures sort on date then home team, which identify a fixture
+    if after != None:
+        afterQuery = {"$or": [
+            {"date": {"$gt": after[0]}},
+            {"date": after[0], "home.team": {"$gt": after[1]}}
+        ]}
+        resultsQuery = {"$and": [resultsQuery, afterQuery]}
+
+    utils.debuggingPrint("Running Results Query: %s", resultsQuery)
+    fixtures = db.results.find(resultsQuery, {"home.players": 0, "away.players": 0}).sort([("date", 1), ("home.team", 1)])
+
+    if limit != None:
+        fixtures = fixtures.limit(limit)
+
+    return fixtures
+
+
+# Fixtures of several clubs, seasons and leagues in one query, in date order
+#
+# clubs - teamnames or teamslugs, all clubs' fixtures when empty
+# fields - the fixture fields wanted e.g. ["date", "home.score", "away.score"],
+#          date and the teamslugs are always included. "home" or "away" for
+#          a whole side. The players placeholders are never included
+# byClub - True for { teamslug: [fixtures] } with a game between two of the
+#          clubs under both, False for a cursor over the fixtures
+def getFixturesBatch(leagues, seasons, clubs=[], fields=None, byClub=True):
+
+    db = getDatabase()
+
+    resultsQuery = __fixturesBatchQuery(leagues, seasons, clubs)
+
+    if fields == None:
+        projection = {"home.players": 0, "away.players": 0}
+    else:
+        fields = set(fields) | {"date", "home.teamslug", "away.teamslug"}
+
+        # A whole side is every field of it but the players placeholders
+        for venue in ["home", "away"]:
+            if venue in fields:
+                fields.remove(venue)
+                fields |= { venue + "." + field for field in ["team", "teamslug", "score"] }
+
+        # MongoDB rejects a path alongside its parent e.g. "home" and "home.teamslug"
+        projection = { field: 1 for field in fields
+                        if not any(field.startswith(parent + ".") for parent in fields) }
+
+    utils.debuggingPrint("Running Results Query: %s", resultsQuery)
+    fixtures = db.results.find(resultsQuery, projection).sort([("date", 1), ("home.team", 1)])
+
+    if not byClub:
+        return fixtures
+
+    clubs = [__teamnameSlug(club) for club in clubs]
+    fixturesByClub = { club: [] for club in clubs }
+
+    for fixture in fixtures:
+        for venue in ["home", "away"]:
+            teamslug = fixture[venue]["teamslug"]
+
+            if not clubs or teamslug in fixturesByClub:
+                fixturesByClub.setdefault(teamslug, []).append(fixture)
+
+    return fixturesByClub
+
+
+def __fixturesBatchQuery(leagues, seasons, clubs=[]):
+
+    resultsQuery = {}
+    resultsQuery["league"] = { "$in": list(leagues) }
+    resultsQuery["season"] = { "$in": list(seasons) }
+
+    if clubs:
+        clubs = [__teamnameSlug(club) for club in clubs]
+
+        # Each side on its own so both use a teamslug index
+        homeQuery = dict(resultsQuery)
+        homeQuery["home.teamslug"] = { "$in": clubs }
+
+        awayQuery = dict(resultsQuery)
+        awayQuery["away.teamslug"] = { "$in": clubs }
+
+        resultsQuery = { "$or": [homeQuery, awayQuery] }
+
+    return resultsQuery
+
+
+# Query for a season's fixtures - a club's, the games between teams in
+# teamFilter, a month's or those between fromDate and untilDate inclusive
+def __fixturesQuery(league, season, club=None, teamFilter=[], month=None, fromDate=None, untilDate=None):
+
+    resultsQuery = {}
+    resultsQuery["season"] = season
+    resultsQuery["league"] = league
+
+    if fromDate != None or untilDate != None:
+        resultsQuery["date"] = {}
+
+        if untilDate != None:
+            resultsQuery["date"]["$lte"] = parse(str(untilDate))
+        if fromDate != None:
+            resultsQuery["date"]["$gte"] = parse(str(fromDate))
+
+    if month and not 1 <= month <= 12:
+        # No such month - matches no fixtures
+        resultsQuery["date"] = { "$in": [] }
+    elif month:
+        # Dates within the month - the season's year up to December, the next year after
+        year = season if month >= const.SEASON_START_MONTH else season + 1
+
+        resultsQuery["date"] = {
+            "$gte": datetime.datetime(year, month, 1),
+            "$lt": datetime.datetime(year + month // 12, month % 12 + 1, 1)
+        }
+
+    if club:
+        club = __teamnameSlug(club)
+        resultsQuery["$or"] = [{"home.teamslug": club}, {"away.teamslug": club}]
+
+    if teamFilter != []:
+        resultsQuery["home.teamslug"] = { "$in": teamFilter}
+        resultsQuery["away.teamslug"] = { "$in": teamFilter}
+
+    return resultsQuery
+
+
+# Match calendars are cached per (league, season, teamFilter, generation) and
+# dropped by invalidateSeasonCaches() like the other season caches
+seasonCalendars = {}
+
+# Returns the sorted match dates of a season - only games between teams in
+# teamFilter when it is given - loading them on first use
+def getSeasonCalendar(league, season, teamFilter=[]):
+
+    # The generation is read before the results, so a calendar built from older
+    # results is never kept under a newer generation
+    key = (league, season, tuple(sorted(teamFilter)), getGeneration(league, season))
+
+    calendar = seasonCalendars.get(key)
+
+    metrics.cacheLookup("calendars", calendar != None)
+
+    if calendar == None:
+        db = getDatabase()
+
+        resultsQuery = __fixturesQuery(league, season, None, teamFilter)
+
+        utils.debuggingPrint("Running Results Query: %s", resultsQuery)
+
+        games = db.results.find(resultsQuery, {"_id": 0, "date": 1}).sort("date", const.SORT_ORDER_ASC)
+
+        calendar = __cacheSeasonValue(seasonCalendars, key, MatchCalendar(game["date"] for game in games))
+
+    return calendar
+
+# Returns an empty standings dictionary - 1 entry per team - for the teams
+# listed in a season document. Teams not in teamFilter are left out
+def __emptyStandings(teams, teamFilter=[]):
+
+    standings = {}
+
+    for team in teams:
+        if teamFilter and team["teamslug"] not in teamFilter:
+            continue
+
+        standings[team["teamslug"]] = {
+                    "teamname": team["teamname"],
+                    "home": {"played": 0,"won": 0,"drawn": 0,"lost": 0,"for": 0,"against": 0,"gd": 0,"points": 0,"form": deque([],5)},
+                    "away": {"played": 0,"won": 0,"drawn": 0,"lost": 0,"for": 0,"against": 0,"gd": 0,"points": 0,"form": deque([],5)},
+                    "totals": {"played": 0,"won": 0,"drawn": 0,"lost": 0,"for": 0,"against": 0,"gd": 0,"points": 0,"form": deque([],5)}
+                    }
+
+    return standings
+
+
+# Points and standings counter of each result
+RESULT_POINTS = { "W": const.POINTS_WIN, "D": const.POINTS_DRAW, "L": const.POINTS_LOSS }
+RESULT_COUNTERS = { "W": "won", "D": "drawn", "L": "lost" }
+
+# Results of a fixture's home & away teams - ("W", "L"), ("L", "W") or ("D", "D")
+def __fixtureResults(home, away):
+
+    if home["score"] > away["score"]: # Home Win
+        return "W", "L"
+    elif away["score"] > home["score"]: # Away Win
+        return "L", "W"
+    else: # draw
+        return "D", "D"
+
+
+# The fixtures matching resultsQuery in date order, with only the teams and
+# scores needed to add them up
+def __scoreFixtures(db, resultsQuery):
+
+    utils.debuggingPrint("Running Results Query: %s", resultsQuery)
+
+    return db.results.find(resultsQuery, 
+                    {"date": 1, "home.teamslug": 1, "home.score": 1, "away.teamslug": 1, "away.score": 1}
+                ).sort([("date", 1), ("home.team", 1)])
+
+
+# Add one fixture's result to the home & away numbers of a standings dictionary.
+# Totals form is updated here, the other totals by __calculateTotals()
+def __addFixtureToStandings(standings, fixture):
+
+    home = fixture["home"]
+    away = fixture["away"]
+
+    homeResult, awayResult = __fixtureResults(home, away)
+
+    for side, opponent, venue, result in [(home, away, "home", homeResult), (away, home, "away", awayResult)]:
+        team = standings[side["teamslug"]]
+        t = team[venue]
+
+        # Add the game, goals, points and form
+        t["played"] += 1
+        t[RESULT_COUNTERS[result]] += 1
+        t["points"] += RESULT_POINTS[result]
+
+        t["for"] += side["score"]
+        t["against"] += opponent["score"]
+        t["gd"] += side["score"] - opponent["score"]
+
+        t["form"].append(result)
+        team["totals"]["form"].append(result)
+
+
+# Set a team's totals to the sum of its home & away numbers
+def __calculateTotals(team):
+
+    for item in ["played","won","lost","drawn","for","against","gd","points"]:
+        team["totals"][item] = team["home"][item] + team["away"][item]
+
+
+# Add up the season's results between fromDate and untilDate into a standings
+# dictionary - the standings in __buildTable's table format
+# builder is "python" to add them up here, "aggregate" to have MongoDB do it or
+# "numpy" to take them from the season's vectorized running totals
+# Returns (standings, date of the last fixture, head to head), or (None, None, None)
+# when there are no fixtures. Head to head is in __addHeadToHead's format
+def buildStandings(league, season, fromDate=None, untilDate=None, teamFilter=[], builder=None):
+
+    if builder == None:
+        builder = const.TABLE_BUILDER
+
+    db = getDatabase()
+
+    resultsQuery = __fixturesQuery(league, season, None, teamFilter, fromDate=fromDate, untilDate=untilDate)
+    dateFilter = resultsQuery.get("date", {})
+
+    ############################################################
+    # Build an empty table containing all teams for specified season and league
+
+    # Get Teams list
+    seasonQuery = { "season": season, "league": league}
+
+    seasonResults = db.seasons.find(seasonQuery).next()
+
+    standings = __emptyStandings(seasonResults["teams"], teamFilter)
+    ############################################################
+
+    headToHead = {}
+
+    if builder == "aggregate":
+        lastFixtureDate = __aggregateStandings(db, resultsQuery, standings, headToHead)
+    elif builder == "numpy":
+        lastFixtureDate = getSeasonStandings(league, season, teamFilter).fill(standings, 
+                            dateFilter.get("$gte"), dateFilter.get("$lte"), headToHead)
+    else:
+        lastFixtureDate = __addUpStandings(db, resultsQuery, standings, headToHead)
+
+    if lastFixtureDate == None:
+        return None, None, None
+
+    # Calculate Totals
+    for team in standings:
+        t = standings[team]
+
+        # Add home & away numbers
+        __calculateTotals(t)
+            
+        # Form - change deque objects to list for json storage
+        for scope in ["home","away","totals"]:
+            t[scope]["form"] = list(t[scope]["form"])
+
+    return standings, lastFixtureDate, headToHead
+
+
+# Vectorized season standings are cached per (league, season, teamFilter, generation)
+seasonStandings = {}
+
+# Returns the vectorized standings for a season, loading its results on first use
+def getSeasonStandings(league, season, teamFilter=[]):
+
+    key = (league, season, tuple(sorted(teamFilter)), getGeneration(league, season))
+
+    standings = seasonStandings.get(key)
+
+    metrics.cacheLookup("standings", standings != None)
+
+    if standings == None:
+        # numpy is only needed when this builder is used
+        import vectortable
+
+        db = getDatabase()
+
+        fixtures = __scoreFixtures(db, __fixturesQuery(league, season, None, teamFilter))
+
+        standings = __cacheSeasonValue(seasonStandings, key, vectortable.SeasonStandings(fixtures))
+
+    return standings
+
+
+# Add each fixture to the standings in turn - returns the date of the last fixture
+def __addUpStandings(db, resultsQuery, standings, headToHead):
+
+    fixtures = __scoreFixtures(db, resultsQuery)
+
+    lastFixtureDate = None
+
+    for fixture in fixtures:
+
+        if lastFixtureDate == None:
+            lastFixtureDate = fixture["date"]
+        else:
+            if fixture["date"] > lastFixtureDate:
+                lastFixtureDate = fixture["date"]
+
+        __addFixtureToStandings(standings, fixture)
+        __addHeadToHead(headToHead, fixture["home"], fixture["away"])
+
+    return lastFixtureDate
+
+
+# Add up the standings in a MongoDB aggregation so only one row per team and
+# venue comes back - returns the date of the last fixture
+def __aggregateStandings(db, resultsQuery, standings, headToHead):
+
+    # Group a venue's results by team. Fixtures are in date order so the last
+    # 5 results pushed are the form
+    def venueTotals(venue, opponent):
+
+        score = "$" + venue + ".score"
+        opponentScore = "$" + opponent + ".score"
+
+        result = {"$cond": [{"$gt": [score, opponentScore]}, "W", 
+                    {"$cond": [{"$lt": [score, opponentScore]}, "L", "D"]}]}
+
+        return [
+            {"$group": {
+                "_id": "$" + venue + ".teamslug",
+                "played": {"$sum": 1},
+                "won": {"$sum": {"$cond": [{"$gt": [score, opponentScore]}, 1, 0]}},
+                "drawn": {"$sum": {"$cond": [{"$eq": [score, opponentScore]}, 1, 0]}},
+                "lost": {"$sum": {"$cond": [{"$lt": [score, opponentScore]}, 1, 0]}},
+                "for": {"$sum": score},
+                "against": {"$sum": opponentScore},
+                "form": {"$push": {"date": "$date", "result": result}}
+            }},
+            {"$project": {"played": 1, "won": 1, "drawn": 1, "lost": 1, "for": 1, "against": 1,
+                            "form": {"$slice": ["$form", -5]}}}
+        ]
+
+    utils.debuggingPrint("Running Results Query: %s", resultsQuery)
+
+    pipeline = [
+        {"$match": resultsQuery},
+        {"$sort": {"date": 1, "home.team": 1}},
+        {"$facet": {
+            "home": venueTotals("home", "away"),
+            "away": venueTotals("away", "home"),
+            "summary": [{"$group": {"_id": None, "lastdate": {"$max": "$date"}}}],
+            "pairs": [{"$group": {
+                "_id": {"home": "$home.teamslug", "away": "$away.teamslug"},
+                "homewon": {"$sum": {"$cond": [{"$gt": ["$home.score", "$away.score"]}, 1, 0]}},
+                "drawn": {"$sum": {"$cond": [{"$eq": ["$home.score", "$away.score"]}, 1, 0]}},
+                "awaywon": {"$sum": {"$cond": [{"$lt": ["$home.score", "$away.score"]}, 1, 0]}},
+                "homefor": {"$sum": "$home.score"},
+                "awayfor": {"$sum": "$away.score"}
+            }}]
+        }}
+    ]
+
+    aggregate = db.results.aggregate(pipeline).next()
+
+    if not aggregate["summary"]:
+        return None
+
+    recentGames = {}
+
+    for venue in ["home", "away"]:
+        for row in aggregate[venue]:
+            t = standings[row["_id"]][venue]
+
+            for item in ["played","won","drawn","lost","for","against"]:
+                t[item] = row[item]
+
+            t["gd"] = row["for"] - row["against"]
+            t["points"] = row["won"] * const.POINTS_WIN + row["drawn"] * const.POINTS_DRAW
+            t["form"] = deque([game["result"] for game in row["form"]], 5)
+
+            recentGames.setdefault(row["_id"], []).extend(row["form"])
+
+    # Totals form - the last 5 of the team's last 5 home and last 5 away games
+    for team in recentGames:
+        games = sorted(recentGames[team], key=lambda game: game["date"])
+        standings[team]["totals"]["form"] = deque([game["result"] for game in games], 5)
+
+    for pair in aggregate["pairs"]:
+        home, away = pair["_id"]["home"], pair["_id"]["away"]
+
+        for team, opponent, venue, won, scored, conceded in [
+                (home, away, "home", pair["homewon"], pair["homefor"], pair["awayfor"]),
+                (away, home, "away", pair["awaywon"], pair["awayfor"], pair["homefor"])]:
+
+            games = headToHead.setdefault(team, {}).setdefault(opponent, {}).setdefault(venue, {"points": 0, "gd": 0, "for": 0})
+
+            games["points"] += won * const.POINTS_WIN + pair["drawn"] * const.POINTS_DRAW
+            games["gd"] += scored - conceded
+            games["for"] += scored
+
+    return aggregate["summary"][0]["lastdate"]
+
+
+# Add one fixture to a head to head matrix of the points, goal difference and
+# goals each team has from its home and its away games against each opponent
+#   { "barcelona": { "real-madrid": { "home": { "points": 3, "gd": 2, "for": 3 },
+#                                     "away": { "points": 1, "gd": 0, "for": 2 } }, ... }, ... }
+def __addHeadToHead(headToHead, home, away):
+
+    homeResult, awayResult = __fixtureResults(home, away)
+
+    for team, opponent, venue, result in [(home, away, "home", homeResult), (away, home, "away", awayResult)]:
+        games = headToHead.setdefault(team["teamslug"], {}).setdefault(opponent["teamslug"], {}).setdefault(venue, {"points": 0, "gd": 0, "for": 0})
+
+        games["points"] += RESULT_POINTS[result]
+        games["gd"] += team["score"] - opponent["score"]
+        games["for"] += team["score"]
+
+
+def __buildTable(league=const.PREMIER_LEAGUE, season=None, fromDate=None, untilDate=None, teamFilter=[], builder=None):
+
+    # Analyse results for season & generate a league table
+    
+    # Table format
+    #
+    # _id:          - SHA1 hash of league + teamFilter + untilDate, fromDate and table format
+    # fromdate:     - date the table starts at i.e. date of first fixture
+    # untildate:    - date table goes up to i.e. date of last fixture
+    # created:      - datetime that table was generated
+    # season:       - season id tag e.g. 2018
+    # league:       - league tag e.g. premier-league
+    # filter: []    - list of teamslugs to filter by 
+    # standings {   - a dictionary containing 1 dictionary per team
+    #   "liverpool": - This is the __teamnameSlug e.g. west-ham-united
+    #               {
+    #                   "teamname": Liverpool,
+    #                   "position": 1,  ## Only set after sorting in getTable
+    #                   "home": { "played": 0, "won": 0, "drawn": 0, "lost": 0, "for": 0, "against": 0,
+    #                              "gd": 0,"points": 0,"form": [] },
+    #                   "away": { "played": 0, "won": 0, "drawn": 0, "lost": 0, "for": 0, "against": 0,
+    #                              "gd": 0,"points": 0,"form": [] },
+    #                   "totals": { "played": 0, "won": 0, "drawn": 0, "lost": 0, "for": 0, "against": 0,
+    #                              "gd": 0,"points": 0,"form": [] }    
+    #               }
+    # }
+    # h2h {         - each team's results against each opponent, see __addHeadToHead
+    # }
+
+    start = time.perf_counter()
+
+    standings, lastFixtureDate, headToHead = buildStandings(league, season, fromDate, untilDate, teamFilter, builder)
+
+    if standings == None: # No fixtures processed so no table either
+        utils.debuggingPrint("No games found - No table produced")
+        return None
+
+    utils.debuggingPrint("Built table for %s %s", league, season, 
+                            league=league, season=season, builder=builder, duration=time.perf_counter() - start)
+
+    return __saveTable(league, season, fromDate, lastFixtureDate, teamFilter, standings, headToHead)
+
+
+# Store standings added up from fromDate to the last fixture's date in the
+# tables collection - returns the table document
+def __saveTable(league, season, fromDate, lastFixtureDate, teamFilter, standings, headToHead):
+
+    db = getDatabase()
+
+    table = {}
+    table["league"] = league
+    table["season"] = season
+
+    table["fromdate"] = parse(str(fromDate))
+    table["untildate"] = parse(str(lastFixtureDate))
+    table["created"] = datetime.datetime.utcnow()
+
+    table["filter"] = teamFilter    
+    table["standings"] = standings
+    table["h2h"] = headToHead
+    
+    table["_id"] = __tableId(league, teamFilter, table["untildate"], table["fromdate"])
+
+    # Save table to DB
+    # specify collection
+    collection = db.tables
+
+    global tablesSaved
+
+    # save results to database
+    # Tables with the same _id hold the same games so saving is an upsert
+    try:
+        collection.replace_one({"_id": table["_id"]}, table, upsert=True)
+    except (pymongo.errors.ServerSelectionTimeoutError, pymongo.errors.OperationFailure) as e:
+        utils.logger.error(e)
+    except:
+        utils.logger.exception("Unhandled error saving table")
+    else:
+        utils.debuggingPrint("Table saved")
+
+        # Request threads and the poller save tables at the same time
+        with tablesSavedLock:
+            tablesSaved += 1
+            trim = tablesSaved % const.TABLES_TRIM_INTERVAL == 0
+
+        if trim:
+            trimTables()
+
+    return table
+
+# generate _id hash - tables saved in an older format get a different _id
+def __tableId(league, teamFilter, untilDate, fromDate):
+
+    idhash = league + str(teamFilter) + str(untilDate) + str(fromDate) + "v" + str(const.TABLE_FORMAT)
+
+    return hashlib.sha1(idhash.encode()).hexdigest()
+
+# Finished, sorted tables from getTable keyed by request and data generation
+tableCache = LRUCache(const.TABLE_CACHE_MAX_ENTRIES, const.TABLE_CACHE_MAX_BYTES)
+metrics.watchCache("tables", tableCache)
+
+# scope must be totals, home or away
+def getTable(league=const.PREMIER_LEAGUE, season=None, 
+            scope=None, teamFilter=[], 
+            fromDate = None,
+            untilDate=None,
+            builder=None
+            ):
+
+    # Sanity check variables
+    if season == None:
+        season = currentSeason()
+    if teamFilter == None:
+        teamFilter = []
+
+    # A table until now runs up to the latest stored result
+    untilLatest = untilDate == None
+
+    if untilDate == None:
+        untilDate = datetime.datetime.now()
+    if fromDate == None:  # Default to beginning of season
+        fromDate = str(season) + "-" + str(const.SEASON_START_MONTH) + "-01" 
+    
+    if scope not in ["totals","home","away"]:
+        scope = "totals"
+    if league == None:
+        league = const.PREMIER_LEAGUE
+    if builder == None:
+        builder = const.TABLE_BUILDER
+
+    # Sort teamFilter to ensure matches, leaving the caller's list alone
+    teamFilter = sorted(teamFilter)
+
+    # check for invalid dates being passed in
+    try:
+        untilDate = parse(str(untilDate))
+    except: # goto default setting
+        untilDate = parse(str(datetime.datetime.now()))
+        untilLatest = True
+    
+    try:
+        fromDate = parse(str(fromDate))
+    except: # goto default setting
+        fromDate = parse(str(season) + "-" + str(const.SEASON_START_MONTH) + "-01")
+
+    # scope will order the final table by home, away or combined totals
+    if (scope != "home") and (scope != "away"):
+        scope = "totals"
+
+    # Serve a table built by the same builder since the season's results last changed
+    cacheKey = (league, season, scope, tuple(teamFilter), fromDate, 
+                None if untilLatest else untilDate, builder, getGeneration(league, season))
+
+    table = tableCache.get(cacheKey)
+
+    if table != None:
+        return table
+
+    # Get table
+    db = getDatabase()
+
+    # 1. find nearest game dates for fromDate and untilDate
+    calendar = getSeasonCalendar(league, season, teamFilter)
+
+    firstGameDate = calendar.nearestAfter(fromDate, fromDate)
+    lastGameDate = calendar.nearestBefore(untilDate, untilDate)
+
+    # 2. check if table exists for exact current parameters, match on _id hash
+
+    # 3. Find Table
+    tableQuery = {"_id": __tableId(league, teamFilter, lastGameDate, firstGameDate)}
+
+    utils.debuggingPrint("Running Table Query: %s", tableQuery)
+    
+    # pull the table from the database, marking it as recently used
+    data = db.tables.find_one_and_update(tableQuery, {"$set": {"created": datetime.datetime.utcnow()}})
+
+    if data == None:
+        utils.debuggingPrint("No tables found - Generate one")
+
+        data = __buildTable(league, season, firstGameDate, lastGameDate, teamFilter, builder)
+
+        if data == None:
+            utils.debuggingPrint("No tables could be generated")
+            return None
+
+    table = __rankStandings(data["standings"], scope, league, data["h2h"])
+
+    tableCache.put(cacheKey, table)
+
+    return table
+
+
+# Sort standings for the requested scope (home, away, totals) by the league's
+# const.TABLE_RANKING rules in a single sort and set positions
+# return sorted list - table - as [ (team, {data}) ]
+def __rankStandings(standings, scope="totals", league=None, headToHead={}):
+
+    rules = const.TABLE_RANKING.get(league, const.DEFAULT_RANKING)
+
+    # Each team's head to head numbers against the teams level with it on
+    # every rule before the first head to head one - from the scope's games,
+    # so a home table only counts the games at home
+    miniLeague = {}
+    venues = ["home", "away"] if scope == "totals" else [scope]
+    headToHeadRules = [rule for rule in rules if rule.startswith("h2h ")]
+
+    if headToHeadRules:
+        levelOn = rules[:rules.index(headToHeadRules[0])]
+        levelTeams = {}
+
+        for teamslug in standings:
+            level = tuple(standings[teamslug][scope][rule] for rule in levelOn)
+            levelTeams.setdefault(level, []).append(teamslug)
+
+        for teams in levelTeams.values():
+            for teamslug in teams:
+                games = headToHead.get(teamslug, {})
+
+                miniLeague[teamslug] = { item: sum(games[opponent][venue][item] for opponent in teams if opponent in games
+                                                        for venue in venues if venue in games[opponent])
+                                            for item in ["points", "gd", "for"] }
+
+    # Highest values first, then by name
+    def rankKey(team):
+
+        key = []
+
+        for rule in rules:
+            if rule.startswith("h2h "):
+                key.append(-miniLeague[team[0]][rule[len("h2h "):]])
+            else:
+                key.append(-team[1][scope][rule])
+
+        key.append(team[0])
+
+        return key
+
+    table = sorted(standings.items(), key=rankKey)
+
+    # Set Position for each team in current sorted state
+    position = 1
+
+    for team in table:
+        team[1]["position"] = position
+        position += 1
+
+    return table
+
+
+# Form indexes are cached per (league, season, generation) like season snapshots
+formIndexes = {}
+
+def buildFormIndex(league, season):
+
+    # Every team's results for the season in date order, so a team's form on
+    # any date is a binary search on its dates
+
+    # Index format
+    #
+    # {
+    #   "liverpool": {
+    #                   "dates": [ datetime of each game ],
+    #                   "results": [ "W", "D", "L" ... ]  - result of each game
+    #                }
+    # }
+
+    db = getDatabase()
+
+    fixtures = __scoreFixtures(db, __fixturesQuery(league, season))
+
+    formIndex = {}
+
+    for fixture in fixtures:
+
+        home = fixture["home"]
+        away = fixture["away"]
+
+        homeResult, awayResult = __fixtureResults(home, away)
+
+        for teamslug, result in [(home["teamslug"], homeResult), (away["teamslug"], awayResult)]:
+            team = formIndex.setdefault(teamslug, {"dates": [], "results": []})
+
+            team["dates"].append(fixture["date"])
+            team["results"].append(result)
+
+    return formIndex
+
+
+# Returns the cached form index for the season, building it on first use
+def getFormIndex(league, season):
+
+    key = (league, season, getGeneration(league, season))
+
+    formIndex = formIndexes.get(key)
+
+    metrics.cacheLookup("form", formIndex != None)
+
+    if formIndex == None:
+        formIndex = __cacheSeasonValue(formIndexes, key, buildFormIndex(league, season))
+
+    return formIndex
+
+
+# Returns a team's form - last 5 results - on a given date
+def getTeamFormByDate(league, teamslug, atDate=None):
+
+    if atDate == None:
+        atDate = datetime.datetime.now()
+
+    formIndex = getFormIndex(league, whichSeason(None,None,atDate))
+
+    if teamslug not in formIndex:
+        return []
+
+    team = formIndex[teamslug]
+
+    # Games played on or before the date
+    played = bisect.bisect_right(team["dates"], atDate)
+
+    return team["results"][max(0, played - 5):played]
+
+
+# Each top team's games against the other top teams, with the opponent's form
+# going into each game and the team's average opponent form score
+#   [ { "teamname": "liverpool", "formaverage": 7.5,
+#       "data": [ { "game": fixture, "form": ["W", "D", ...], "formscore": 7 }, ... ] } ]
+# The game dates are formatted for display e.g. 27 Jan
+def buildBigSixForm(league, season, teamFilter):
+
+    teamData = { team: { "teamname": team, "data": [], "formaverage": 0 } for team in teamFilter }
+
+    # Every game between the teams in one query, each one listed under both teams
+    for game in getFixtures(league, season, None, teamFilter):
+
+        # Opponent's form up to the day before the game
+        gameDate = game["date"] - timedelta(days=1)
+
+        for team, opponent in [(game["home"]["teamslug"], game["away"]["teamslug"]), 
+                                (game["away"]["teamslug"], game["home"]["teamslug"])]:
+
+            form = getTeamFormByDate(league, opponent, gameDate)
+
+            formscore = sum(RESULT_POINTS[result] for result in form)
+
+            teamData[team]["data"].append({ "game": game, "form": form, "formscore": formscore })
+
+        # Format Game.date to 27 Jan
+        game["date"] = game["date"].strftime("%d %b")
+
+    for team in teamData.values():
+        # only count the form towards average if more than 4 games played
+        counted = [match["formscore"] for match in team["data"] if len(match["form"]) >= 4]
+
+        if counted:
+            team["formaverage"] = round(sum(counted) / len(counted), 2)
+
+    return [teamData[team] for team in teamFilter]
+
+
+def printTable(table):
+    if table == None:
+        return ""
+        
+    for x in table:
+        print (x[1]["teamname"] + " " + str(x[1]["totals"]["gd"]) + " " + str(x[1]["totals"]["points"]) + \
+                " " + str(x[1]["totals"]["form"]))
+
+
+# Season snapshots are cached per (league, season, generation) and dropped by
+# invalidateSeasonCaches() whenever new results are saved for that season
+seasonSnapshots = {}
+
+def buildSeasonSnapshots(league, season):
+
+    # Walk the season's results once in date order and record the cumulative
+    # table after every match day and every week
+    
+    # Snapshots format
+    #
+    # matchdays: [  - one entry per match date
+    #               {
+    #                   "date": datetime of the match day,
+    #                   "table": [ (teamslug, TeamStanding) ] - rows read as {"teamname": Liverpool, "position": 1,
+    #                               "totals": { "played": 0, "won": 0, "drawn": 0, "lost": 0, "for": 0,
+    #                                           "against": 0, "gd": 0,"points": 0,"form": [] }}
+    #               }
+    #            ]
+    # weeks: []  - as matchdays, 1 entry per week from the first weekend.
+    #              The table is the one from the last match day on or before the date
+
+    db = getDatabase()
+
+    snapshots = { "matchdays": [], "weeks": [] }
+
+    seasonQuery = { "season": season, "league": league}
+
+    try:
+        seasonResults = db.seasons.find(seasonQuery).next()
+    except StopIteration:
+        utils.debuggingPrint("No teams found - No snapshots produced")
+        return snapshots
+
+    standings = __emptyStandings(seasonResults["teams"])
+    headToHead = {}
+
+    fixtures = __scoreFixtures(db, __fixturesQuery(league, season))
+
+    matchDate = None
+
+    for fixture in fixtures:
+
+        # Record the table for the previous match day before moving on
+        if matchDate != None and fixture["date"] > matchDate:
+            snapshots["matchdays"].append(__snapshotStandings(league, matchDate, standings, headToHead))
+
+        matchDate = fixture["date"]
+
+        __addFixtureToStandings(standings, fixture)
+        __addHeadToHead(headToHead, fixture["home"], fixture["away"])
+
+    if matchDate == None: # No fixtures processed so no snapshots either
+        return snapshots
+
+    snapshots["matchdays"].append(__snapshotStandings(league, matchDate, standings, headToHead))
+
+    # Weekly tables - weekends start with the first match day
+    matchDates = [matchday["date"] for matchday in snapshots["matchdays"]]
+
+    currentWeek = matchDates[0] + timedelta(days=3) ## Add days until end of weekend
+
+    while currentWeek <= matchDates[-1] + timedelta(days=3):
+
+        matchday = snapshots["matchdays"][bisect.bisect_right(matchDates, currentWeek) - 1]
+
+        snapshots["weeks"].append({ "date": currentWeek, "table": matchday["table"] })
+
+        currentWeek = currentWeek + timedelta(days=7)
+
+    return snapshots
+
+
+# Copy the totals of the current standings into a ranked snapshot for the given date
+def __snapshotStandings(league, matchDate, standings, headToHead):
+
+    snapshot = {}
+
+    for teamslug in standings:
+        team = standings[teamslug]
+
+        __calculateTotals(team)
+
+        snapshot[teamslug] = TeamStanding(team["teamname"])
+        snapshot[teamslug].setScope("totals", team["totals"])
+
+    return { "date": matchDate, "table": __rankStandings(snapshot, "totals", league, headToHead) }
+
+
+# Returns cached snapshots for the season, building them on first use
+def getSeasonSnapshots(league, season):
+
+    key = (league, season, getGeneration(league, season))
+
+    snapshots = seasonSnapshots.get(key)
+
+    metrics.cacheLookup("snapshots", snapshots != None)
+
+    if snapshots == None:
+        snapshots = __cacheSeasonValue(seasonSnapshots, key, buildSeasonSnapshots(league, season))
+
+    return snapshots
+
+
+# Live polling
+#
+# pollFixtures() fetches the current month's results page every interval
+# seconds and saves any new or changed results. New results are added to the
+# season's standings, kept from the last cycle, and the season table is saved
+# from them, rather than adding up the whole season again
+#
+# Yields a report for each cycle
+# {
+#   "cycle": 1, "league": premier-league, "season": 2019, "status": 200 or 304 Not Modified,
+#   "fixtures": fixtures on the page, "inserted": new results, "updated": changed scores,
+#   "rebuilt": True if the standings were added up from scratch,
+#   "fetch_ms": fetching the page, "update_ms": saving results and the table,
+#   "total_ms": fetch to updated table, "materialize_ms": rebuilding the season's materialized view
+# }
+def pollFixtures(league=const.PREMIER_LEAGUE, interval=const.POLL_INTERVAL, cycles=None, baseUrl=const.BASE_URL):
+
+    live = { "season": None, "standings": None, "generation": None, "etag": None, "lastmodified": None }
+
+    cycle = 0
 
-    # save results to database
-    try:
-        collection.insert_many(results, ordered=False)
-    except (pymongo.errors.BulkWriteError, pymongo.errors.ServerSelectionTimeoutError,
-            pymongo.errors.OperationFailure) as e:
-        print (e)
-        #print(e.details["writeErrors"])
-    except:
-        print("Unhandled Error")
-    else:
-        print("Results saved")
+    while cycles == None or cycle < cycles:
 
+        if cycle:
+            time.sleep(interval)
 
-def getFixtures(league=const.PREMIER_LEAGUE, season=currentSeason(), club=None, teamFilter = [], month=None):
-    
-    # Sanity check
-    if season == None:
-        season = currentSeason()
-    if league == None:
-        league = const.PREMIER_LEAGUE
+        cycle += 1
 
-    db = getDatabase()
- 
-    resultsQuery = {}
-    resultsQuery["season"] = season
-    resultsQuery["league"] = league
+        try:
+            report = __pollCycle(league, baseUrl, live)
+        except (IOError, pymongo.errors.PyMongoError) as e:
+            utils.logger.error(e, extra={"league": league, "cycle": cycle})
+            continue
+        except StopIteration: # No season document to add the standings up for
+            utils.logger.warning("No teams found for %s - run cli.py build-teams", league, extra={"league": league})
+            continue
 
-    if month:
-        resultsQuery["$expr"] = { "$eq": [{ "$month": "$date" }, month] }
+        report["cycle"] = cycle
 
-    if club:
-        club = __teamnameSlug(club)
-        resultsQuery["$or"] = [{"home.teamslug": club}, {"away.teamslug": club}]
+        yield report
 
-    #resultsQuery["date"] = {"$gte": fromDate,"$lte":untilDate}
-    
-    if teamFilter != []:
-        resultsQuery["home.teamslug"] = { "$in": teamFilter}
-        resultsQuery["away.teamslug"] = { "$in": teamFilter}
 
-    utils.debuggingPrint("Running Results Query: " + str(resultsQuery))
-    fixtures = db.results.find(resultsQuery).sort([("date", 1), ("home.team", 1)])
+def __pollCycle(league, baseUrl, live):
 
-    return list(fixtures)
+    start = time.perf_counter()
 
+    now = datetime.datetime.now()
+    season = whichSeason(now.month, now.year)
 
-# Get the date of the nearest game to the given targetDate for the given query
-# Either before it SORT_ORDER_DESC or after it SORT_ORDER_ASC
-def getNearestGameDate(query, targetDate, beforeOrAfter):
-    
-    db = getDatabase()
+    url = baseUrl.replace("LEAGUETAG", league) + str(now.year) + "-" + "{:02d}".format(now.month) + "?filter=results"
 
-    if beforeOrAfter == const.SORT_ORDER_ASC:
-        query["date"] = {"$gte":targetDate}
-    elif beforeOrAfter == const.SORT_ORDER_DESC:
-        query["date"] = {"$lte":targetDate}
+    # The season changed since the last cycle
+    if live["season"] != season:
+        live.update({ "season": season, "standings": None, "generation": None, "etag": None, "lastmodified": None })
 
-    game = db.results.find(query, {"date": 1}).sort("date", beforeOrAfter).limit(1)
-    
-    for result in game:
-        return result["date"]
+    headers = {}
 
-    return targetDate
+    if live["etag"]:
+        headers["If-None-Match"] = live["etag"]
+    if live["lastmodified"]:
+        headers["If-Modified-Since"] = live["lastmodified"]
 
-# Get start and end date of season so far
-def getSeasonDates(query):
-    
-    seasonDates = { "startDate": None, "endDate": None}
+    utils.debuggingPrint("Polling %s", url)
 
-    db = getDatabase()
-    
-    # get first game
-    game = db.results.find(query, {"date": 1}).sort("date", const.SORT_ORDER_ASC).limit(1)
-    
-    for result in game:
-        seasonDates["startDate"] = result["date"]
+    page = __fetchPage(url, headers)
 
-    # get last game
-    game = db.results.find(query, {"date": 1}).sort("date", const.SORT_ORDER_DESC).limit(1)
-    
-    for result in game:
-        seasonDates["endDate"] = result["date"]
+    fetched = time.perf_counter()
 
-    return seasonDates
+    report = { "league": league, "season": season, "status": page.status_code, 
+                "fixtures": 0, "inserted": 0, "updated": 0, "rebuilt": False }
 
-def __buildTable(league=const.PREMIER_LEAGUE, season=currentSeason(), fromDate=None, untilDate=None, teamFilter=[]):
+    if page.status_code != 304:
+        live["etag"] = page.headers.get("ETag")
+        live["lastmodified"] = page.headers.get("Last-Modified")
 
-    # Analyse results for season & generate a league table
-    
-    # Table format
-    #
-    # _id:          - SHA1 hash of league + teamFilter + untilDate and fromDate
-    # fromdate:     - date the table starts at i.e. date of first fixture
-    # untildate:    - date table goes up to i.e. date of last fixture
-    # created:      - datetime that table was generated
-    # season:       - season id tag e.g. 2018
-    # league:       - league tag e.g. premier-league
-    # filter: []    - list of teamslugs to filter by 
-    # standings {   - a dictionary containing 1 dictionary per team
-    #   "liverpool": - This is the __teamnameSlug e.g. west-ham-united
-    #               {
-    #                   "teamname": Liverpool,
-    #                   "position": 1,  ## Only set after sorting in getTable
-    #                   "home": { "played": 0, "won": 0, "drawn": 0, "lost": 0, "for": 0, "against": 0,
-    #                              "gd": 0,"points": 0,"form": [] },
-    #                   "away": { "played": 0, "won": 0, "drawn": 0, "lost": 0, "for": 0, "against": 0,
-    #                              "gd": 0,"points": 0,"form": [] },
-    #                   "totals": { "played": 0, "won": 0, "drawn": 0, "lost": 0, "for": 0, "against": 0,
-    #                              "gd": 0,"points": 0,"form": [] }    
-    #               }
-    # }
+        fixtures = parseMonthlyFixtures(page.content, now.year, now.month, league)
 
-    db = getDatabase()
+        report["fixtures"] = len(fixtures)
 
-    resultsQuery = {}
-    resultsQuery["season"] = season
-    resultsQuery["league"] = league
-    
-    dateFilter  = {}
+        # saveResults() diffs the fixtures against those stored
+        saved = saveResults(fixtures)
 
-    if untilDate != None:
-        dateFilter["$lte"] = parse(str(untilDate))
-    if fromDate != None:
-        dateFilter["$gte"] = parse(str(fromDate))
-    if dateFilter:
-        resultsQuery["date"] = dateFilter
+        if saved == None:
+            raise IOError("Results for " + url + " could not be saved")
 
-    if teamFilter != []:
-        resultsQuery["home.teamslug"] = { "$in": teamFilter}
-        resultsQuery["away.teamslug"] = { "$in": teamFilter}
+        report["inserted"] = len(saved["inserted"])
+        report["updated"] = len(saved["updated"])
 
-    utils.debuggingPrint("Running Results Query: " + str(resultsQuery))
+        if saved["inserted"] or saved["updated"]:
+            inserted = set(saved["inserted"])
+            newFixtures = sorted([fixture for fixture in fixtures if fixture["_id"] in inserted], 
+                                    key=lambda fixture: (fixture["date"], fixture["home"]["team"]))
 
-    fixtures = db.results.find(resultsQuery).sort([("date", 1), ("home.team", 1)])
+            # saveResults() bumped the season's generation once for these results
+            generation = getGeneration(league, season)
 
-    lastFixtureDate = None
-    fixture_count = 0
-    
-    ############################################################
-    # Build an empty table containing all teams for specified season and league
+            report["rebuilt"] = not __applyToLiveStandings(live, league, season, newFixtures, saved["updated"], generation)
 
-    table = {}
-    table["league"] = league
-    table["season"] = season
+            __saveTable(league, season, live["firstdate"], live["lastfixture"][0], [], 
+                        __storableStandings(live["standings"]), live["h2h"])
 
-    table["fromdate"] = parse(str(fromDate))
-    table["untildate"] = None
-    table["created"] = parse(str(datetime.datetime.now()))
+    finished = time.perf_counter()
 
-    table["filter"] = teamFilter    
-    table["standings"] = {}
+    report["fetch_ms"] = round((fetched - start) * 1000, 1)
+    report["update_ms"] = round((finished - fetched) * 1000, 1)
+    report["total_ms"] = round((finished - start) * 1000, 1)
+    report["materialize_ms"] = 0
 
-    standings = {}
+    if (report["inserted"] or report["updated"]) and const.MATERIALIZE_AFTER_SCRAPE:
+        materializeSeason(league, season)
 
-    # Get Teams list
-    seasonQuery = { "season": season, "league": league}
+        report["materialize_ms"] = round((time.perf_counter() - finished) * 1000, 1)
 
-    seasonResults = db.seasons.find(seasonQuery).next()
+    return report
 
-    for team in seasonResults["teams"]:
-        addTeam = True
-        if teamFilter:
-            if team["teamslug"] not in teamFilter:
-                addTeam = False
-        
-        if addTeam == True:
-            standings[team["teamslug"]] = {
-                        "teamname": team["teamname"],
-                        "home": {"played": 0,"won": 0,"drawn": 0,"lost": 0,"for": 0,"against": 0,"gd": 0,"points": 0,"form": deque([],5)},
-                        "away": {"played": 0,"won": 0,"drawn": 0,"lost": 0,"for": 0,"against": 0,"gd": 0,"points": 0,"form": deque([],5)},
-                        "totals": {"played": 0,"won": 0,"drawn": 0,"lost": 0,"for": 0,"against": 0,"gd": 0,"points": 0,"form": deque([],5)}
-                        }
-    ############################################################
 
-    for fixture in fixtures:
+# Add new fixtures to the live standings - returns False if they had to be
+# added up from scratch instead, i.e. on the first cycle, when a stored score
+# changed, a new fixture comes before one already added or another process
+# (a scrape or a second poller) saved results since the last cycle.
+# generation is the season's generation after this cycle's results were saved
+def __applyToLiveStandings(live, league, season, newFixtures, updated, generation):
 
-        if lastFixtureDate == None:
-            lastFixtureDate = fixture["date"]
-        else:
-            if fixture["date"] > lastFixtureDate:
-                lastFixtureDate = fixture["date"]
+    # Only this cycle's bump since the standings were last brought up to date
+    onlyOwnResults = live["generation"] == generation - 1
 
-        home = fixture["home"]
-        away = fixture["away"]            
-        
-        # Add goals to table
-        # home team
-        standings[home["teamslug"]]["home"]["for"] += home["score"]
-        standings[home["teamslug"]]["home"]["against"] += away["score"]
-        standings[home["teamslug"]]["home"]["gd"] += (home["score"] - away["score"])
-        # away team
-        standings[away["teamslug"]]["away"]["for"] += away["score"]
-        standings[away["teamslug"]]["away"]["against"] += home["score"]
-        standings[away["teamslug"]]["away"]["gd"] += (away["score"] - home["score"])       
-
-        # Who won? # Update Points and Form for each outcome
-        if home["score"] > away["score"]: # Home Win
-            standings[home["teamslug"]]["home"]["won"] += 1
-            standings[home["teamslug"]]["home"]["points"] += const.POINTS_WIN
-            standings[away["teamslug"]]["away"]["lost"] += 1
-            
-            standings[home["teamslug"]]["home"]["form"].append("W")
-            standings[away["teamslug"]]["away"]["form"].append("L")            
-            standings[home["teamslug"]]["totals"]["form"].append("W")
-            standings[away["teamslug"]]["totals"]["form"].append("L")
-
-        elif away["score"] > home["score"]: # Away Win
-            standings[away["teamslug"]]["away"]["won"] += 1
-            standings[away["teamslug"]]["away"]["points"] += const.POINTS_WIN
-            standings[home["teamslug"]]["home"]["lost"] += 1
-
-            standings[home["teamslug"]]["home"]["form"].append("L")
-            standings[away["teamslug"]]["away"]["form"].append("W")
-            standings[home["teamslug"]]["totals"]["form"].append("L")
-            standings[away["teamslug"]]["totals"]["form"].append("W")            
-                        
-        else: # draw
-            standings[home["teamslug"]]["home"]["drawn"] += 1
-            standings[home["teamslug"]]["home"]["points"] += const.POINTS_DRAW
-            standings[away["teamslug"]]["away"]["drawn"] += 1
-            standings[away["teamslug"]]["away"]["points"] += const.POINTS_DRAW
-
-            standings[home["teamslug"]]["home"]["form"].append("D")
-            standings[away["teamslug"]]["away"]["form"].append("D")
-            standings[home["teamslug"]]["totals"]["form"].append("D")
-            standings[away["teamslug"]]["totals"]["form"].append("D")
-
-        # Add the game
-        standings[home["teamslug"]]["home"]["played"] += 1
-        standings[away["teamslug"]]["away"]["played"] += 1
-
-        fixture_count += 1
-
-    if fixture_count == 0: # No fixtures processed so no table either
-        utils.debuggingPrint("No games found - No table produced")
-        return None
+    live["generation"] = generation
 
-    table["standings"] = standings
-    table["untildate"] = parse(str(lastFixtureDate))
-    
-    # generate _id hash
-    idhash = league + str(teamFilter) + str(table["untildate"]) + str(table["fromdate"])
-    table["_id"] = hashlib.sha1(idhash.encode()).hexdigest()
+    if live["standings"] != None and not updated and onlyOwnResults and \
+        all((fixture["date"], fixture["home"]["team"]) > live["lastfixture"] for fixture in newFixtures):
 
-    # Calculate Totals
-    for team in table["standings"]:
-        t = table["standings"][team]
+        for fixture in newFixtures:
+            __addFixtureToStandings(live["standings"], fixture)
+            __addHeadToHead(live["h2h"], fixture["home"], fixture["away"])
 
-        # Add home & away numbers
-        for item in ["played","won","lost","drawn","for","against","gd","points"]:
-            t["totals"][item] = t["home"][item] + t["away"][item]
-            
-        # Form - change deque objects to list for json storage
-        for scope in ["home","away","totals"]:
-            t[scope]["form"] = list(t[scope]["form"])
-        
-    # Save table to DB
-    # specify collection
-    collection = db.tables
+            live["lastfixture"] = (fixture["date"], fixture["home"]["team"])
 
-    # save results to database
-    try:
-        collection.insert_one(table)
-    except (pymongo.errors.BulkWriteError, pymongo.errors.ServerSelectionTimeoutError,
-            pymongo.errors.OperationFailure) as e:
-        print(e)
-    except:
-        print("Unhandled Error")
-    else:
-        print("Table saved")
+        for team in live["standings"].values():
+            __calculateTotals(team)
 
-    return table
+        return True
 
-# scope must be totals, home or away
-def getTable(league=const.PREMIER_LEAGUE, season=currentSeason(), 
-            scope=None, teamFilter=[], 
-            fromDate = None,
-            untilDate=datetime.datetime.now()            
-            ):
+    standings, lastFixtureDate, headToHead = buildStandings(league, season)
 
-    # Sanity check variables
-    if season == None:
-        season = currentSeason()
-    if teamFilter == None:
-        teamFilter = []
-    if untilDate == None:
-        untilDate = datetime.datetime.now()
-    if fromDate == None:  # Default to beginning of season
-        fromDate = str(season) + "-" + str(const.SEASON_START_MONTH) + "-01" 
-    
-    if scope not in ["totals","home","away"]:
-        scope = "totals"
-    if league == None:
-        league = const.PREMIER_LEAGUE
+    # Form back to deques, to keep the last 5 as results are added
+    for team in standings.values():
+        for scope in ["home", "away", "totals"]:
+            team[scope]["form"] = deque(team[scope]["form"], 5)
 
-    # Sort teamFilter to ensure matches
-    teamFilter.sort()
+    db = getDatabase()
 
-    # check for invalid dates being passed in
-    try:
-        untilDate = parse(str(untilDate))
-    except: # goto default setting
-        untilDate = parse(str(datetime.datetime.now()))
-    
-    try:
-        fromDate = parse(str(fromDate))
-    except: # goto default setting
-        fromDate = parse(str(season) + "-" + str(const.SEASON_START_MONTH) + "-01")
+    lastFixture = db.results.find({"league": league, "season": season}, {"date": 1, "home.team": 1}
+                    ).sort([("date", const.SORT_ORDER_DESC), ("home.team", const.SORT_ORDER_DESC)]).limit(1).next()
 
-    # scope will order the final table by home, away or combined totals
-    if (scope != "home") and (scope != "away"):
-        scope = "totals"
+    live["standings"] = standings
+    live["h2h"] = headToHead
+    live["firstdate"] = getSeasonCalendar(league, season).first()
+    live["lastfixture"] = (lastFixture["date"], lastFixture["home"]["team"])
 
-    # Get table
-    db = getDatabase()
+    return False
 
-    # 1. find nearest game dates for fromDate and untilDate
 
-    resultsQuery = {}
-    resultsQuery["league"] = league
-    resultsQuery["season"] = season
-    resultsQuery["date"] = {"$gte": fromDate,"$lte":untilDate}
-    
-    if teamFilter != []:
-        resultsQuery["home.teamslug"] = { "$in": teamFilter}
-        resultsQuery["away.teamslug"] = { "$in": teamFilter}
+# A copy of standings with each form as a list, for storing
+def __storableStandings(standings):
 
-    firstGameDate = getNearestGameDate(resultsQuery, fromDate, const.SORT_ORDER_ASC)
-    lastGameDate = getNearestGameDate(resultsQuery, untilDate, const.SORT_ORDER_DESC)
+    stored = {}
 
-    # 2. check if table exists for exact current parameters, match on _id hash
+    for teamslug, team in standings.items():
+        stored[teamslug] = dict(team)
 
-    # 3. Find Table
-    try:        
-        # generate _id hash
-        idhash = league + str(teamFilter) + str(lastGameDate) + str(firstGameDate)
-        _id = hashlib.sha1(idhash.encode()).hexdigest()
+        for scope in ["home", "away", "totals"]:
+            stored[teamslug][scope] = dict(team[scope])
+            stored[teamslug][scope]["form"] = list(team[scope]["form"])
 
-        tableQuery = {"_id": _id}
+    return stored
 
-        utils.debuggingPrint("Running Table Query: " + str(tableQuery))
-        
-        # use .next() to get document rather than cursor
-        # pull the latest table from the database        
-        data = db.tables.find(tableQuery).sort("untildate", -1).limit(1).next() 
 
-    except StopIteration:
-        utils.debuggingPrint("No tables found - Generate one")
+# Build the current season's tables, match calendar, snapshots (graphs) and
+# form index for each league, so a web worker's first requests don't wait for them
+def warmCaches(leagues=None, season=None):
 
-        data = __buildTable(league, season, firstGameDate, lastGameDate, teamFilter)
+    if leagues == None:
+        leagues = const.WARM_LEAGUES
+    if season == None:
+        season = currentSeason()
 
-        if data == None:
-            utils.debuggingPrint("No tables could be generated")
-            return None
+    for league in leagues:
+        try:
+            getSeasonCalendar(league, season)
 
-    standings = data["standings"]
+            for scope in ["totals", "home", "away"]:
+                getTable(league, season, scope)
 
-    # Sort by Name, Goals For, GD and then Points for the requested scope (home, away, totals)
-    # return sorted list - table - as [ (team, {data}) ]
-    table = sorted(standings.items(),key=lambda x: x[0])
-    table = sorted(table,key=lambda x: x[1][scope]["for"], reverse=True)
-    table = sorted(table,key=lambda x: x[1][scope]["gd"], reverse=True)
-    table = sorted(table,key=lambda x: x[1][scope]["points"], reverse=True)
+            getSeasonSnapshots(league, season)
+            getFormIndex(league, season)
+        except StopIteration: # No season document yet
+            utils.debuggingPrint("No %s %s season to warm", league, season)
+        except pymongo.errors.PyMongoError as e:
+            utils.logger.error(e, extra={"league": league, "season": season})
 
-    # Set Position for each team in current sorted state
-    position = 1
 
-    for team in table:
-        team[1]["position"] = position
-        position += 1
+# Web worker threads build season caches while syncGenerations() drops them
+seasonCachesLock = threading.Lock()
 
-    return table
+# Store a built season value - returns it, as another thread may drop the
+# season's entries straight after
+def __cacheSeasonValue(cache, key, value):
 
+    with seasonCachesLock:
+        cache[key] = value
 
-# Returns a team's form on a given date
-def getTeamFormByDate(league, teamslug, atDate=datetime.datetime.now()):
+    return value
 
-    # Generate a table for the date
-    table = getTable(league, season=whichSeason(None,None,atDate), 
-            scope=None, teamFilter=[], 
-            fromDate = None,
-            untilDate=atDate)
-    
-    # Find the team and return the form
-    for team in table:
-        if team[0] == teamslug:
-            return team[1]["totals"]["form"]
 
-    return []
+# Drop everything cached in memory for a league's season, of every generation
+def invalidateSeasonCaches(league, season):
 
+    with seasonCachesLock:
+        for cache in [seasonSnapshots, formIndexes, seasonCalendars, seasonStandings]:
+            for key in [key for key in list(cache) if key[:2] == (league, season)]:
+                cache.pop(key, None)
 
-def printTable(table):
-    if table == None:
-        return ""
-        
-    for x in table:
-        print (x[1]["teamname"] + " " + str(x[1]["totals"]["gd"]) + " " + str(x[1]["totals"]["points"]) + \
-                " " + str(x[1]["totals"]["form"]))
+    tableCache.dropWhere(lambda key: key[0] == league and key[1] == season)
 
 
 def buildPositionsGraph(league, season, teamFilter=[]):
@@ -587,34 +1986,37 @@ def buildPositionsGraph(league, season, teamFilter=[]):
     #                               [   1       1           3           ]
     #                               [   2       1           4           ]
     #                           ]
-    # listing position of teams after 1 week intervals from the first weekend
+    # listing position of teams after each match day
 
-    # Get dates of matches in season
-    resultsQuery = {}
-    resultsQuery["league"] = league
-    resultsQuery["season"] = season
-    
-    db = getDatabase()
+    # 2. Get the table for each match day
+    return __buildGraph(getSeasonSnapshots(league, season)["matchdays"], "Match Day", "position", teamFilter)
 
-    matchDates = db.results.distinct("date", resultsQuery)
-    
-    matchDates.sort()
+def buildPointsGraph(league, season, teamFilter=[]):
+
+    # 1. Build array in form    [
+    #                               ['Week', 'liverpool', 'chelsea'.... ]
+    #                               [   1       3           3           ]
+    #                               [   2       6           4           ]
+    #                           ]
+    # listing points of teams after 1 week intervals from the first weekend
 
-    # 2. Get a table for each match day
+    # 2. Get the table for each week from startdate
+    return __buildGraph(getSeasonSnapshots(league, season)["weeks"], "Week", "points", teamFilter)
+
+# Build a graph array from a list of snapshots, reading item from each team's row
+def __buildGraph(snapshots, label, item, teamFilter=[]):
 
     dataArray = []
     headerArray = []
 
-    for matchdate in matchDates:
+    for snapshot in snapshots:
 
-        standings = getTable(league, season, None, [], None, matchdate)
-        
         # sort by name to ensure array consistancy
-        standings = sorted(standings,key=lambda x: x[0])
+        standings = sorted(snapshot["table"],key=lambda x: x[0])
 
         # build header array of team names on 1st pass
         if not headerArray:
-            headerArray.append("Match Day")
+            headerArray.append(label)
 
             for team in standings:
                 if teamFilter:
@@ -628,78 +2030,134 @@ def buildPositionsGraph(league, season, teamFilter=[]):
         # Add details to array
         weeklyData = []
         
-        weeklyData.append(matchdate.strftime("%d %b"))
+        weeklyData.append(snapshot["date"].strftime("%d %b"))
 
         for team in standings:
+            if item == "position":
+                value = team[1]["position"]
+            else:
+                value = team[1]["totals"][item]
+
             if teamFilter:
                 if team[0] in teamFilter:            
-                    weeklyData.append(team[1]["position"])
+                    weeklyData.append(value)
             else:
-                weeklyData.append(team[1]["position"])
+                weeklyData.append(value)
 
         dataArray.append(weeklyData)
 
     return dataArray
 
-def buildPointsGraph(league, season, teamFilter=[]):
+# Materialized season views
+#
+# Everything the season pages show, built ahead of time and stored in the
+# snapshots collection for the season's current data generation, so a page
+# is one indexed read
+#
+# _id:          - SHA1 hash of league + season + generation
+# league, season, generation
+# created:      - datetime the view was built
+# columns:      - names of the values in each matchday table row
+# matchdays: [  - the table after each match day
+#               { "date": datetime, "table": [ [ "liverpool", "Liverpool", 1, 3, ... "WDW" ] ] }
+#            ]
+# tables:       - the season's table for each scope, as getTable returns it
+#               { "totals": [ (teamslug, {data}) ], "home": [...], "away": [...] }
+# positions:    - buildPositionsGraph for every team
+# points:       - buildPointsGraph for every team
+# bigsixform:   - buildBigSixForm for the league's TOPTEAMS
 
-    # 1. Build array in form    [
-    #                               ['Week', 'liverpool', 'chelsea'.... ]
-    #                               [   1       3           3           ]
-    #                               [   2       6           4           ]
-    #                           ]
-    # listing position of teams after 1 week intervals from the first weekend
+SNAPSHOT_COLUMNS = ["teamslug", "teamname", "position", 
+                    "played", "won", "drawn", "lost", "for", "against", "gd", "points", "form"]
 
-    # Get start and end date for season
-    resultsQuery = {}
-    resultsQuery["league"] = league
-    resultsQuery["season"] = season
-    
-    seasonDates = getSeasonDates(resultsQuery)
+def materializeSeason(league, season):
 
-    # 2. Get a table for each week from startdate
-    currentWeek = seasonDates["startDate"] + timedelta(days=3) ## Add days until end of weekend   
+    start = time.perf_counter()
 
-    dataArray = []
-    headerArray = []
+    generation = getGeneration(league, season)
 
-    while currentWeek <= seasonDates["endDate"] + timedelta(days=3):
+    idhash = league + str(season) + str(generation)
 
-        standings = getTable(league, season, None, [], None, currentWeek)
-        
-        # sort by name to ensure array consistancy
-        standings = sorted(standings,key=lambda x: x[0])
+    view = {}
+    view["_id"] = hashlib.sha1(idhash.encode()).hexdigest()
+    view["league"] = league
+    view["season"] = season
+    view["generation"] = generation
+    view["created"] = datetime.datetime.utcnow()
+    view["columns"] = SNAPSHOT_COLUMNS
 
-        # build header array of team names on 1st pass
-        if not headerArray:
-            headerArray.append("Week")
+    view["matchdays"] = []
 
-            for team in standings:
-                if teamFilter:
-                    if team[0] in teamFilter:
-                        headerArray.append(team[0])
-                else:
-                    headerArray.append(team[0])
+    for matchday in getSeasonSnapshots(league, season)["matchdays"]:
+        rows = []
 
-            dataArray.append(headerArray)
+        for teamslug, team in matchday["table"]:
+            totals = team["totals"]
 
-        # Add details to array
-        weeklyData = []
-        
-        weeklyData.append(currentWeek.strftime("%d %b"))
+            rows.append([teamslug, team["teamname"], team["position"]] + 
+                        [totals[item] for item in SNAPSHOT_COLUMNS[3:-1]] + ["".join(totals["form"])])
 
-        for team in standings:
-            if teamFilter:
-                if team[0] in teamFilter:            
-                    weeklyData.append(team[1]["totals"]["points"])
-            else:
-                weeklyData.append(team[1]["totals"]["points"])
+        view["matchdays"].append({ "date": matchday["date"], "table": rows })
 
-        dataArray.append(weeklyData)
+    if not view["matchdays"]: # No results for the season
+        return None
 
-        currentWeek = currentWeek + timedelta(days=7)
+    view["tables"] = { scope: getTable(league, season, scope) for scope in ["totals", "home", "away"] }
+
+    view["positions"] = buildPositionsGraph(league, season)
+    view["points"] = buildPointsGraph(league, season)
+
+    view["bigsixform"] = []
+
+    if league in const.TOPTEAMS:
+        for team in buildBigSixForm(league, season, const.TOPTEAMS[league]):
+            for match in team["data"]:
+                match["game"] = match["game"].toDocument()
+
+            view["bigsixform"].append(team)
+
+    db = getDatabase()
+
+    try:
+        db.snapshots.replace_one({"_id": view["_id"]}, view, upsert=True)
+
+        # Views of older data are never read again
+        db.snapshots.delete_many({"league": league, "season": season, "generation": {"$ne": generation}})
+    except pymongo.errors.PyMongoError as e:
+        utils.logger.error(e)
+        return None
+
+    utils.debuggingPrint("Materialized %s %s generation %s", league, season, generation, 
+                            league=league, season=season, generation=generation, duration=time.perf_counter() - start)
+
+    return view
+
+
+# The materialized view of a season's current data, or None if it hasn't been built.
+# fields - the parts of the view wanted e.g. ["tables.totals", "positions"], None for all
+def getMaterializedSeason(league, season, fields=None):
+
+    db = getDatabase()
+
+    viewQuery = { "league": league, "season": season, "generation": getGeneration(league, season) }
+
+    utils.debuggingPrint("Running Snapshots Query: %s", viewQuery)
+
+    projection = None if fields == None else { field: 1 for field in fields }
+
+    return db.snapshots.find_one(viewQuery, projection)
+
+
+# Only the teamFilter columns of a graph array, all of them when teamFilter is empty
+def filterGraph(dataArray, teamFilter=[]):
+
+    if not teamFilter or not dataArray:
+        return dataArray
+
+    columns = [0] + [column for column, team in enumerate(dataArray[0]) if column > 0 and team in teamFilter]
+
+    return [[row[column] for column in columns] for row in dataArray]
 
-    return dataArray
 
 def buildLeagueTeamsList(league, season, teamList=[]):
 
@@ -726,7 +2184,7 @@ def buildLeagueTeamsList(league, season, teamList=[]):
         collection = db.seasons
         collection.insert_one(data)
         
-        print ("Teams Stored")
+        utils.logger.info("Teams stored for %s %s", league, season, extra={"league": league, "season": season})
 
     except:
         return
@@ -754,19 +2212,10 @@ la_liga_teams_2018 = ['Alavés', 'Athletic Bilbao', 'Atlético Madrid', 'Barcelo
                     'Real Madrid', 'Real Sociedad', 'Real Valladolid', 'Sevilla', 'Valencia', 'Villarreal']
 """
 
-scrapeFixtures(2019,const.PREMIER_LEAGUE,8,6)
-#buildLeagueTeamsList(const.PREMIER_LEAGUE, 2019,getDistinctTeams(const.PREMIER_LEAGUE,2019))
-
-
-
-#getDistinctTeams(const.LA_LIGA,2018)
-
-#buildLeagueTeamsList(const.LA_LIGA, 2018,la_liga_teams_2018)
+# Scraping and maintenance jobs are run from cli.py
 
 #print (buildPositionsGraph("premier-league",2018))
 
-#scrapeFixtures(2018,const.LA_LIGA)
-
 """getTable(league=const.PREMIER_LEAGUE, season=currentSeason(), 
             scope=None, teamFilter=[], 
             fromDate = None,
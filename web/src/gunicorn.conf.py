@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+
+# gunicorn settings for serving the web app with several worker processes
+#
+# gunicorn -c gunicorn.conf.py app:app
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import constant as const
+
+bind = const.WEB_BIND
+workers = const.WEB_WORKERS or multiprocessing.cpu_count() * 2 + 1
+threads = const.WEB_THREADS
+timeout = const.WEB_TIMEOUT
+
+# Import the app once in the master, workers share its memory after forking.
+# Nothing connects to MongoDB at import so no client is copied into the workers
+preload_app = True
+
+# Workers write their metrics here so /metrics reports every worker's
+if const.METRICS_DIR == None:
+    const.METRICS_DIR = os.path.join(tempfile.gettempdir(), "football-metrics")
+
+
+# Runs in the master before the app is imported - metrics start from zero
+# with each start of the server
+def on_starting(server):
+
+    shutil.rmtree(const.METRICS_DIR, ignore_errors=True)
+    os.makedirs(const.METRICS_DIR)
+
+
+# Runs in each worker after the fork, before it accepts requests
+def post_worker_init(worker):
+
+    import football as fb
+
+    start = time.perf_counter()
+
+    fb.warmCaches()
+
+    worker.log.info("Worker %s caches warmed in %.2fs", worker.pid, time.perf_counter() - start)
+
+
+def worker_exit(server, worker):
+
+    import football as fb
+    import metrics
+
+    fb.closeDatabase()
+
+    # Keep everything the worker recorded since its last write
+    metrics.writeMetrics()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+
+from flask import current_app, request, make_response
+import football as fb
+from football import const
+from cache import LRUCache
+import metrics
+import functools
+import gzip
+import hashlib
+
+# brotli is optional - pages are gzipped without it
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# HTTP caching for the web pages and JSON API
+#
+# A page only changes when new results are saved for its league's season, so
+# its ETag is made from the request path and query string and the season's
+# data generation. Conditional requests get a 304 before the view runs and
+# rendered pages are kept compressed, per ETag and content encoding, for
+# everyone else
+
+renderedPages = LRUCache(const.RENDERED_PAGES_MAX_ENTRIES, const.RENDERED_PAGES_MAX_BYTES)
+metrics.watchCache("pages", renderedPages)
+
+# seasonOf maps the view's arguments to the (league, season) the page shows.
+# Streamed responses are sent as they are made rather than kept
+def cachedPage(seasonOf, streamed=False):
+
+    def decorator(view):
+
+        @functools.wraps(view)
+        def cachedView(*args, **kwargs):
+
+            league, season = seasonOf(*args, **kwargs)
+
+            if season == None:
+                season = fb.currentSeason()
+
+            etag = request.full_path + league + str(season) + str(fb.getGeneration(league, season))
+            etag = hashlib.sha1(etag.encode()).hexdigest()
+
+            if request.if_none_match.contains_weak(etag):
+                response = current_app.response_class(status=304)
+            elif streamed:
+                response = make_response(view(*args, **kwargs))
+            else:
+                encoding = __acceptedEncoding()
+                page = renderedPages.get((etag, encoding))
+
+                if page == None:
+                    response = make_response(view(*args, **kwargs))
+
+                    # Redirects and errors aren't kept
+                    if response.status_code != 200:
+                        return response
+
+                    body, contentEncoding = __compress(response.get_data(), encoding)
+                    page = (body, response.content_type, contentEncoding)
+
+                    renderedPages.put((etag, encoding), page)
+
+                response = current_app.response_class(page[0], content_type=page[1])
+
+                if page[2] != "identity":
+                    response.headers["Content-Encoding"] = page[2]
+
+            response.set_etag(etag, weak=True)
+            response.vary.add("Accept-Encoding")
+            response.cache_control.public = True
+
+            if season < fb.currentSeason():
+                response.cache_control.max_age = const.PAGE_MAX_AGE_PAST_SEASON
+            else:
+                response.cache_control.max_age = const.PAGE_MAX_AGE
+
+            return response
+
+        return cachedView
+
+    return decorator
+
+
+# Best content encoding the client accepts - br, gzip or identity
+def __acceptedEncoding():
+
+    encodings = ["br", "gzip"] if brotli != None else ["gzip"]
+
+    return request.accept_encodings.best_match(encodings, default="identity")
+
+
+# Compress a page for an encoding - returns (body, encoding used)
+def __compress(body, encoding):
+
+    if len(body) < const.COMPRESS_MIN_SIZE:
+        return body, "identity"
+
+    if encoding == "br":
+        return brotli.compress(body, quality=const.COMPRESS_LEVEL), encoding
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=const.COMPRESS_LEVEL), encoding
+
+    return body, "identity"
+
+
+# (league, season) of results and bigsixform pages
+def leagueSeason(league=const.PREMIER_LEAGUE, season=None, **kwargs):
+    return league, season
+
+
+# (league, season) of table pages - tables from or until a date are in that date's season
+def tableSeason(league=const.PREMIER_LEAGUE, season=None, scope="totals", 
+            fromseason=None, frommonth=None, fromday=None,
+            untilseason=None, untilmonth=None, untilday=None
+            ):
+
+    if (untilseason != None) and (untilmonth != None) and (untilday != None):
+        season = fb.whichSeason(untilmonth, untilseason)
+
+    if (fromseason != None) and (frommonth != None) and (fromday != None):
+        season = fb.whichSeason(frommonth, fromseason)
+
+    return league, season
@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+
+from pymongo import monitoring
+import bisect
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+import constant as const
+
+# Prometheus metrics - request times per route, MongoDB commands per collection
+# and cache hit ratios, rendered in the text format for /metrics
+#
+# Every process records its own numbers. With METRICS_DIR set each one writes
+# them to <pid>-<random id>.json there every METRICS_WRITE_INTERVAL seconds, and
+# /metrics adds up the files of every process, so whichever gunicorn worker
+# answers a scrape reports the whole server. Files of workers that have exited
+# are kept, so counters never go backwards while the server runs - the random
+# id keeps a later worker given the same pid from writing over one
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Every metric made, in the order they're rendered
+registry = []
+
+metricsLock = threading.Lock()
+
+
+class Metric:
+
+    # Values per tuple of label values, in labels order
+
+    kind = "untyped"
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.values = {}
+
+        registry.append(self)
+
+    # Values of several processes added together
+    def merge(self, total, values):
+        for labelValues, value in values.items():
+            total[labelValues] = total.get(labelValues, 0) + value
+
+    def samples(self, values):
+        for labelValues, value in sorted(values.items()):
+            yield self.name, self.labelText(labelValues), value
+
+    def render(self, values):
+
+        lines = ["# HELP " + self.name + " " + self.description, "# TYPE " + self.name + " " + self.kind]
+
+        for name, labels, value in self.samples(values):
+            lines.append(name + labels + " " + formatValue(value))
+
+        return lines
+
+    def labelText(self, labelValues, extra=()):
+
+        pairs = list(zip(self.labels, labelValues)) + list(extra)
+
+        if not pairs:
+            return ""
+
+        return "{" + ",".join(label + '="' + escapeLabel(str(value)) + '"' for label, value in pairs) + "}"
+
+
+class Counter(Metric):
+
+    kind = "counter"
+
+    def inc(self, *labelValues, amount=1):
+
+        startWriter()
+
+        with metricsLock:
+            self.values[labelValues] = self.values.get(labelValues, 0) + amount
+
+
+class Gauge(Metric):
+
+    # Gauges of exited processes aren't added in
+
+    kind = "gauge"
+
+    def set(self, value, *labelValues):
+        with metricsLock:
+            self.values[labelValues] = value
+
+
+class Histogram(Metric):
+
+    # Values are [count in each bucket, count, sum] - buckets are rendered cumulative
+
+    kind = "histogram"
+
+    def __init__(self, name, description, labels=(), buckets=const.METRICS_REQUEST_BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = sorted(buckets)
+
+    def observe(self, value, *labelValues):
+
+        startWriter()
+
+        bucket = bisect.bisect_left(self.buckets, value)
+
+        with metricsLock:
+            counts = self.values.setdefault(labelValues, [[0] * len(self.buckets), 0, 0.0])
+
+            if bucket < len(self.buckets):
+                counts[0][bucket] += 1
+
+            counts[1] += 1
+            counts[2] += value
+
+    def merge(self, total, values):
+
+        for labelValues, (buckets, count, value) in values.items():
+            counts = total.setdefault(labelValues, [[0] * len(self.buckets), 0, 0.0])
+
+            counts[0] = [a + b for a, b in zip(counts[0], buckets)]
+            counts[1] += count
+            counts[2] += value
+
+    def samples(self, values):
+
+        for labelValues, (buckets, count, total) in sorted(values.items()):
+            cumulative = 0
+
+            for bound, bucketCount in zip(self.buckets, buckets):
+                cumulative += bucketCount
+                yield self.name + "_bucket", self.labelText(labelValues, [("le", bound)]), cumulative
+
+            yield self.name + "_bucket", self.labelText(labelValues, [("le", "+Inf")]), count
+            yield self.name + "_count", self.labelText(labelValues), count
+            yield self.name + "_sum", self.labelText(labelValues), total
+
+
+def formatValue(value):
+
+    if isinstance(value, float):
+        return repr(value)
+
+    return str(value)
+
+
+def escapeLabel(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+############################################################
+# Metrics
+
+requestSeconds = Histogram("football_request_seconds", "Time to answer a request, by route",
+                            ["route", "method", "status"], const.METRICS_REQUEST_BUCKETS)
+
+mongoCommands = Counter("football_mongodb_commands_total", "MongoDB commands sent, by collection",
+                            ["collection", "command", "outcome"])
+
+mongoCommandSeconds = Histogram("football_mongodb_command_seconds", "MongoDB command round trip time, by collection",
+                            ["collection", "command"], const.METRICS_COMMAND_BUCKETS)
+
+cacheHits = Counter("football_cache_hits_total", "Lookups found in an in-process cache", ["cache"])
+cacheMisses = Counter("football_cache_misses_total", "Lookups not found in an in-process cache", ["cache"])
+cacheHitRatio = Gauge("football_cache_hit_ratio", "Share of lookups found in an in-process cache", ["cache"])
+cacheEntries = Gauge("football_cache_entries", "Entries held by an in-process cache", ["cache"])
+
+
+# A lookup in one of the season caches kept in a dictionary
+def cacheLookup(cache, hit):
+
+    if hit:
+        cacheHits.inc(cache)
+    else:
+        cacheMisses.inc(cache)
+
+
+# LRUCaches report their own hits and misses - their numbers are read as the
+# metrics are written or rendered
+watchedCaches = {}
+
+def watchCache(cache, lruCache):
+    watchedCaches[cache] = lruCache
+
+
+def __collectCaches():
+
+    for cache, lruCache in watchedCaches.items():
+        stats = lruCache.stats()
+
+        with metricsLock:
+            cacheHits.values[(cache,)] = stats["hits"]
+            cacheMisses.values[(cache,)] = stats["misses"]
+
+        cacheEntries.set(stats["entries"], cache)
+
+
+# Records each command sent by a MongoClient made with
+# event_listeners=[metrics.commandListener]
+class CommandMetrics(monitoring.CommandListener):
+
+    def __init__(self):
+        self.collections = {}
+        self.lock = threading.Lock()
+
+    def started(self, event):
+
+        # The collection is the command's value e.g. {"find": "results", ...},
+        # or its "collection" for a getMore
+        collection = event.command.get("collection") if event.command_name == "getMore" else event.command.get(event.command_name)
+
+        if not isinstance(collection, str):
+            collection = ""
+
+        with self.lock:
+            self.collections[(event.connection_id, event.request_id)] = collection
+
+    def succeeded(self, event):
+        self.record(event, "succeeded")
+
+    def failed(self, event):
+        self.record(event, "failed")
+
+    def record(self, event, outcome):
+
+        with self.lock:
+            collection = self.collections.pop((event.connection_id, event.request_id), "")
+
+        mongoCommands.inc(collection, event.command_name, outcome)
+        mongoCommandSeconds.observe(event.duration_micros / 1000000, collection, event.command_name)
+
+
+commandListener = CommandMetrics()
+
+
+############################################################
+# Sharing between processes
+
+# Process whose writer thread is running - a forked worker starts its own
+writerPid = None
+writerLock = threading.Lock()
+
+# (pid, random id) naming this process's file
+processFile = None
+
+def startWriter():
+
+    global writerPid
+
+    if const.METRICS_DIR == None or writerPid == os.getpid():
+        return
+
+    with writerLock:
+        if writerPid != os.getpid():
+            # Numbers copied from the parent when forked are in the parent's file
+            if writerPid != None:
+                with metricsLock:
+                    for metric in registry:
+                        metric.values.clear()
+
+            writerPid = os.getpid()
+
+            threading.Thread(target=__writeEvery, args=(const.METRICS_WRITE_INTERVAL,), daemon=True).start()
+
+
+def __writeEvery(interval):
+
+    while True:
+        time.sleep(interval)
+        writeMetrics()
+
+
+# This process's file in METRICS_DIR
+def __processPath():
+
+    global processFile
+
+    with writerLock:
+        if processFile == None or processFile[0] != os.getpid():
+            processFile = (os.getpid(), uuid.uuid4().hex)
+
+    return os.path.join(const.METRICS_DIR, str(processFile[0]) + "-" + processFile[1] + ".json")
+
+
+# Write this process's numbers to its file in METRICS_DIR
+def writeMetrics():
+
+    if const.METRICS_DIR == None:
+        return
+
+    __collectCaches()
+
+    with metricsLock:
+        snapshot = { metric.name: [[list(labelValues), value] for labelValues, value in metric.values.items()]
+                        for metric in registry }
+
+    path = __processPath()
+
+    os.makedirs(const.METRICS_DIR, exist_ok=True)
+
+    # Readers never see a half written file
+    with open(path + ".tmp", "w") as f:
+        json.dump(snapshot, f)
+
+    os.replace(path + ".tmp", path)
+
+
+# Whether the process that wrote a file is still running - its pid is in use
+# and it has written the file lately, so not an exited process's pid reused
+def __processRunning(path):
+
+    try:
+        os.kill(int(os.path.basename(path).split("-")[0]), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    except ValueError:
+        return False
+
+    try:
+        return time.time() - os.path.getmtime(path) <= 2 * const.METRICS_WRITE_INTERVAL
+    except OSError:
+        return False
+
+
+# { metric name: values } of every process that has written its metrics, or
+# of this process alone without METRICS_DIR
+def __allValues():
+
+    if const.METRICS_DIR == None:
+        __collectCaches()
+
+        with metricsLock:
+            return { metric.name: dict(metric.values) for metric in registry }
+
+    writeMetrics()
+
+    totals = { metric.name: {} for metric in registry }
+
+    for path in glob.glob(os.path.join(const.METRICS_DIR, "*.json")):
+        try:
+            with open(path) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            continue
+
+        running = __processRunning(path)
+
+        for metric in registry:
+            if metric.kind == "gauge" and not running:
+                continue
+
+            values = { tuple(labelValues): value for labelValues, value in snapshot.get(metric.name, []) }
+
+            metric.merge(totals[metric.name], values)
+
+    return totals
+
+
+# Every metric in the Prometheus text format
+def render():
+
+    values = __allValues()
+
+    hits = values[cacheHits.name]
+    misses = values[cacheMisses.name]
+
+    values[cacheHitRatio.name] = { labelValues: hits.get(labelValues, 0) / (hits.get(labelValues, 0) + misses.get(labelValues, 0))
+                                    for labelValues in set(hits) | set(misses)
+                                    if hits.get(labelValues, 0) + misses.get(labelValues, 0) }
+
+    lines = []
+
+    for metric in registry:
+        lines.extend(metric.render(values[metric.name]))
+
+    return "\n".join(lines) + "\n"
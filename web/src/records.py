@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+
+from array import array
+import sys
+
+# Compact records for fixtures and team standings
+#
+# Both keep their values in __slots__ rather than nested dictionaries, and
+# still answer the dictionary lookups the templates and callers use, e.g.
+# fixture["home"]["teamslug"], fixture.home.teamslug or row["totals"]["form"]
+
+
+# Form is packed 2 bits per result, oldest first, last 5 results only
+FORM_LENGTH = 5
+FORM_CODES = {"W": 1, "D": 2, "L": 3}
+FORM_RESULTS = {1: "W", 2: "D", 3: "L"}
+FORM_MASK = (1 << (2 * FORM_LENGTH)) - 1
+
+def packForm(form):
+
+    packed = 0
+
+    for result in form:
+        packed = ((packed << 2) | FORM_CODES[result]) & FORM_MASK
+
+    return packed
+
+def unpackForm(packed):
+
+    form = []
+
+    for shift in range(2 * (FORM_LENGTH - 1), -1, -2):
+        code = (packed >> shift) & 3
+
+        if code:
+            form.append(FORM_RESULTS[code])
+
+    return form
+
+
+class Side:
+
+    # One team's side of a fixture
+
+    __slots__ = ("team", "teamslug", "score")
+
+    def __init__(self, team, teamslug, score):
+        self.team = team
+        self.teamslug = teamslug
+        self.score = score
+
+    def __getitem__(self, key):
+        if key == "players":
+            return [{}]
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def toDocument(self):
+        return { "team": self.team, "teamslug": self.teamslug, "score": self.score, "players": [{}] }
+
+
+class Fixture:
+
+    # One result - see __scrapeMonthlyFixtures for the document it replaces
+
+    __slots__ = ("_id", "date", "season", "league", "tag", "attendance", "home", "away")
+
+    def __init__(self, _id, date, season, league, home, away, tag="", attendance=None):
+        self._id = _id
+        self.date = date
+        self.season = season
+        self.league = league
+        self.tag = tag
+        self.attendance = attendance
+        self.home = home
+        self.away = away
+
+    @classmethod
+    def fromDocument(cls, document):
+
+        home = document["home"]
+        away = document["away"]
+
+        # Team names repeat in every fixture so share one copy of each
+        return cls(
+            document["_id"], document["date"], document.get("season"), document.get("league"),
+            Side(sys.intern(home["team"]), sys.intern(home["teamslug"]), home["score"]),
+            Side(sys.intern(away["team"]), sys.intern(away["teamslug"]), away["score"]),
+            document.get("tag", ""), document.get("attendance")
+        )
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self.__slots__
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def toDocument(self):
+        return {
+            "_id": self._id, "date": self.date, "season": self.season, "league": self.league,
+            "attendance": self.attendance, "tag": self.tag,
+            "home": self.home.toDocument(), "away": self.away.toDocument()
+        }
+
+
+# Values kept for each scope of a team's standing, form packed by packForm()
+COUNTERS = ["played", "won", "drawn", "lost", "for", "against", "gd", "points"]
+FIELDS = COUNTERS + ["form"]
+FIELD_INDEX = { item: index for index, item in enumerate(FIELDS) }
+SCOPES = ["home", "away", "totals"]
+SCOPE_INDEX = { scope: index for index, scope in enumerate(SCOPES) }
+
+
+class ScopeView:
+
+    # Dictionary style view of one scope of a TeamStanding, e.g. row["totals"]
+
+    __slots__ = ("standing", "offset")
+
+    def __init__(self, standing, scope):
+        self.standing = standing
+        self.offset = SCOPE_INDEX[scope] * len(FIELDS)
+
+    def __getitem__(self, key):
+
+        value = self.standing.values[self.offset + FIELD_INDEX[key]]
+
+        return unpackForm(value) if key == "form" else value
+
+    def __getattr__(self, key):
+        try:
+            return self[key]
+        except KeyError:
+            raise AttributeError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def toDocument(self):
+        return { key: self[key] for key in FIELDS }
+
+
+class TeamStanding:
+
+    # One team's row of a table - the values of every scope in a single array
+    # of ints rather than a dictionary per scope
+
+    __slots__ = ("teamname", "position", "values")
+
+    def __init__(self, teamname, position=None):
+        self.teamname = teamname
+        self.position = position
+        self.values = array("i", [0] * (len(SCOPES) * len(FIELDS)))
+
+    @classmethod
+    def fromDocument(cls, document):
+
+        standing = cls(sys.intern(document["teamname"]), document.get("position"))
+
+        for scope in SCOPES:
+            if scope in document:
+                standing.setScope(scope, document[scope])
+
+        return standing
+
+    def setScope(self, scope, values):
+
+        offset = SCOPE_INDEX[scope] * len(FIELDS)
+
+        for item in COUNTERS:
+            self.values[offset + FIELD_INDEX[item]] = values[item]
+
+        self.values[offset + FIELD_INDEX["form"]] = packForm(values["form"])
+
+    def __getitem__(self, key):
+
+        if key in SCOPE_INDEX:
+            return ScopeView(self, key)
+
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        setattr(self, key, value)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def toDocument(self):
+
+        document = { "teamname": self.teamname, "position": self.position }
+
+        for scope in SCOPES:
+            document[scope] = self[scope].toDocument()
+
+        return document
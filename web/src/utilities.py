@@ -1,13 +1,69 @@
 import json
+import logging
 import constant as const 
 import unicodedata
 
+# The app's log - level and style from LOG_LEVEL and LOG_STYLE, set by
+# configureLogging() in app.py and cli.py
+logger = logging.getLogger("football")
+
+def configureLogging(level=None):
+
+    if const.LOG_STYLE == "keyvalue":
+        handler = logging.StreamHandler()
+        handler.setFormatter(KeyValueFormatter())
+
+        logging.basicConfig(handlers=[handler])
+    else:
+        logging.basicConfig(format=const.LOG_FORMAT)
+
+    logger.setLevel(level or const.LOG_LEVEL)
+
+
+# Log lines of key=value pairs - the time, level, logger, process and message,
+# then the fields passed with extra= e.g.
+#   logger.info("Table built", extra={"league": league, "season": season, "duration": 0.12})
+#   time=2019-05-12T15:00:01 level=INFO logger=football pid=12 msg="Table built" duration=0.12 league=premier-league season=2018
+class KeyValueFormatter(logging.Formatter):
+
+    # Attributes every record has - any others came in through extra=
+    standard = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+    def __init__(self):
+        super().__init__(datefmt="%Y-%m-%dT%H:%M:%S")
+
+    def format(self, record):
+
+        pairs = [("time", self.formatTime(record, self.datefmt)), ("level", record.levelname), 
+                    ("logger", record.name), ("pid", record.process), ("msg", record.getMessage())]
+
+        pairs += sorted((key, value) for key, value in vars(record).items() if key not in self.standard)
+
+        if record.exc_info:
+            pairs.append(("exception", self.formatException(record.exc_info)))
+
+        return " ".join(key + "=" + self.formatField(value) for key, value in pairs)
+
+    # Values with spaces, quotes or = are quoted, JSON style
+    def formatField(self, value):
+
+        if isinstance(value, float):
+            value = round(value, 6)
+
+        text = str(value)
+
+        if text == "" or any(c in text for c in ' "=\n\\'):
+            return json.dumps(text)
+
+        return text
+
 def printJSON(data, indentvalue=2):
     print(json.dumps(json.loads(data), indent=indentvalue, sort_keys=True))
 
-def debuggingPrint(output):
-    if const.VERBOSE:
-        print (output + "\n")
+# Arguments are only formatted into output, %-style, when debug logging is on.
+# Keyword arguments are logged as fields
+def debuggingPrint(output, *args, **fields):
+    logger.debug(output, *args, extra=fields)
 
 def strip_accents(text):
 
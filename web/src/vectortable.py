@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+
+import bisect
+from collections import deque
+import numpy as np
+import constant as const
+
+# Vectorized standings for a league season
+#
+# Every team's counters are added up per match day and stored as running
+# totals, so the table for any window of match days is the difference of two
+# rows:  counters(fromDate, untilDate) = cumulative[until] - cumulative[from]
+
+# Counters for each team and venue
+PLAYED, WON, DRAWN, LOST, FOR, AGAINST = range(6)
+COUNTERS = ["played", "won", "drawn", "lost", "for", "against"]
+
+VENUES = ["home", "away"]
+HOME, AWAY = range(2)
+
+
+class SeasonStandings:
+
+    # fixtures - the season's results in date order, as stored in the results collection
+    # teams - teamslugs of the teams in the season, any others playing are added
+    def __init__(self, fixtures, teams=[]):
+
+        fixtures = list(fixtures)
+
+        self.teams = list(teams)
+        self.teamIndex = { teamslug: index for index, teamslug in enumerate(self.teams) }
+
+        for fixture in fixtures:
+            for venue in VENUES:
+                if fixture[venue]["teamslug"] not in self.teamIndex:
+                    self.teamIndex[fixture[venue]["teamslug"]] = len(self.teams)
+                    self.teams.append(fixture[venue]["teamslug"])
+
+        homeTeams, awayTeams, homeScores, awayScores, fixtureDates = [], [], [], [], []
+
+        # Each team's results, for form - { teamslug: { "totals": ([day], [result]), "home": ..., "away": ... } }
+        self.results = { teamslug: { "totals": ([], []), "home": ([], []), "away": ([], []) } for teamslug in self.teams }
+
+        self.dates = []
+
+        for fixture in fixtures:
+            home = fixture["home"]
+            away = fixture["away"]
+
+            if not self.dates or fixture["date"] > self.dates[-1]:
+                self.dates.append(fixture["date"])
+
+            day = len(self.dates) - 1
+
+            homeTeams.append(self.teamIndex[home["teamslug"]])
+            awayTeams.append(self.teamIndex[away["teamslug"]])
+            homeScores.append(home["score"])
+            awayScores.append(away["score"])
+            fixtureDates.append(day)
+
+            if home["score"] > away["score"]:
+                homeResult, awayResult = "W", "L"
+            elif away["score"] > home["score"]:
+                homeResult, awayResult = "L", "W"
+            else:
+                homeResult, awayResult = "D", "D"
+
+            for teamslug, venue, result in [(home["teamslug"], "home", homeResult), (away["teamslug"], "away", awayResult)]:
+                for scope in ["totals", venue]:
+                    self.results[teamslug][scope][0].append(day)
+                    self.results[teamslug][scope][1].append(result)
+
+        # Every fixture, for head to head numbers
+        self.fixtures = (fixtureDates, homeTeams, awayTeams, homeScores, awayScores)
+
+        homeTeams = np.array(homeTeams, dtype=np.int64)
+        awayTeams = np.array(awayTeams, dtype=np.int64)
+        homeScores = np.array(homeScores, dtype=np.int64)
+        awayScores = np.array(awayScores, dtype=np.int64)
+        fixtureDates = np.array(fixtureDates, dtype=np.int64)
+
+        # Counters added on each match day - [day, team, venue, counter]
+        daily = np.zeros((len(self.dates), len(self.teams), len(VENUES), len(COUNTERS)), dtype=np.int32)
+
+        homeWins = (homeScores > awayScores).astype(np.int32)
+        awayWins = (awayScores > homeScores).astype(np.int32)
+        draws = (homeScores == awayScores).astype(np.int32)
+
+        for teams, venue, scored, conceded, won, lost in [
+                (homeTeams, HOME, homeScores, awayScores, homeWins, awayWins),
+                (awayTeams, AWAY, awayScores, homeScores, awayWins, homeWins)]:
+
+            np.add.at(daily, (fixtureDates, teams, venue, PLAYED), 1)
+            np.add.at(daily, (fixtureDates, teams, venue, WON), won)
+            np.add.at(daily, (fixtureDates, teams, venue, DRAWN), draws)
+            np.add.at(daily, (fixtureDates, teams, venue, LOST), lost)
+            np.add.at(daily, (fixtureDates, teams, venue, FOR), scored)
+            np.add.at(daily, (fixtureDates, teams, venue, AGAINST), conceded)
+
+        # Running totals - row n holds everything before match day n
+        self.cumulative = np.zeros((len(self.dates) + 1,) + daily.shape[1:], dtype=np.int32)
+        np.cumsum(daily, axis=0, out=self.cumulative[1:])
+
+    # Match day range [first, last) covering fromDate to untilDate inclusive
+    def window(self, fromDate=None, untilDate=None):
+
+        first = 0 if fromDate == None else bisect.bisect_left(self.dates, fromDate)
+        last = len(self.dates) if untilDate == None else bisect.bisect_right(self.dates, untilDate)
+
+        return first, max(first, last)
+
+    # Counters for every team in a window - [team, venue, counter]
+    def counters(self, first, last):
+        return self.cumulative[last] - self.cumulative[first]
+
+    # A team's last 5 results in a window for scope totals, home or away
+    def form(self, teamslug, first, last, scope="totals"):
+
+        days, results = self.results[teamslug][scope]
+
+        end = bisect.bisect_left(days, last)
+        start = max(bisect.bisect_left(days, first), end - 5)
+
+        return results[start:end]
+
+    # Head to head points, goal difference and goals for every pairing in a
+    # window, added to a dictionary in football's head to head format
+    def headToHead(self, headToHead, first, last):
+
+        fixtureDates, homeTeams, awayTeams, homeScores, awayScores = self.fixtures
+
+        start = bisect.bisect_left(fixtureDates, first)
+        end = bisect.bisect_left(fixtureDates, last)
+
+        for index in range(start, end):
+            home, away = self.teams[homeTeams[index]], self.teams[awayTeams[index]]
+            homeScore, awayScore = homeScores[index], awayScores[index]
+
+            if homeScore > awayScore:
+                homePoints, awayPoints = const.POINTS_WIN, const.POINTS_LOSS
+            elif awayScore > homeScore:
+                homePoints, awayPoints = const.POINTS_LOSS, const.POINTS_WIN
+            else:
+                homePoints, awayPoints = const.POINTS_DRAW, const.POINTS_DRAW
+
+            for team, opponent, venue, points, scored, conceded in [
+                    (home, away, "home", homePoints, homeScore, awayScore),
+                    (away, home, "away", awayPoints, awayScore, homeScore)]:
+
+                games = headToHead.setdefault(team, {}).setdefault(opponent, {}).setdefault(venue, {"points": 0, "gd": 0, "for": 0})
+
+                games["points"] += points
+                games["gd"] += scored - conceded
+                games["for"] += scored
+
+        return headToHead
+
+    # Fill a standings dictionary, in the tables collection format, for the
+    # window - returns the date of the last fixture in it or None if it has none.
+    # headToHead, if given, gets the head to head numbers for the window too
+    def fill(self, standings, fromDate=None, untilDate=None, headToHead=None):
+
+        first, last = self.window(fromDate, untilDate)
+
+        if first == last:
+            return None
+
+        counters = self.counters(first, last).tolist()
+
+        for teamslug in standings:
+            if teamslug not in self.teamIndex:
+                continue
+
+            team = counters[self.teamIndex[teamslug]]
+
+            for venue, scope in enumerate(VENUES):
+                t = standings[teamslug][scope]
+
+                for counter, item in enumerate(COUNTERS):
+                    t[item] = team[venue][counter]
+
+                t["gd"] = t["for"] - t["against"]
+                t["points"] = t["won"] * const.POINTS_WIN + t["drawn"] * const.POINTS_DRAW
+                t["form"] = deque(self.form(teamslug, first, last, scope), 5)
+
+            standings[teamslug]["totals"]["form"] = deque(self.form(teamslug, first, last), 5)
+
+        if headToHead != None:
+            self.headToHead(headToHead, first, last)
+
+        return self.dates[last - 1]